@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ======================================================
+# ADMISSION CONTROL
+# ======================================================
+# One limiter per expensive stage. Each stage has its own pool of slots,
+# so a burst of PDF builds or batch jobs queues behind its own limit and
+# never takes capacity from interactive inference.
+
+STAGE_DEFAULTS = {
+    # stage: (max concurrent, queue timeout in seconds)
+    "inference": (os.cpu_count() or 2, 5.0),
+    "pdf": (2, 15.0),
+    "batch": (1, 30.0)
+}
+
+
+class ServerBusy(Exception):
+
+    def __init__(self, stage, waited):
+        super().__init__(f"{stage} stage busy after waiting {waited:.1f}s")
+        self.stage = stage
+        self.waited = waited
+
+
+class StageLimiter:
+
+    def __init__(self, name, limit, timeout):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @contextmanager
+    def slot(self):
+
+        start = time.monotonic()
+
+        with self._cond:
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+
+            waited = time.monotonic() - start
+
+            if not admitted:
+                self.rejected += 1
+                raise ServerBusy(self.name, waited)
+
+            self.active += 1
+            self.admitted += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "stage": self.name,
+                "limit": self.limit,
+                "active": self.active,
+                "queued": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "mean_wait_s": round(self.wait_total / self.admitted, 4) if self.admitted else 0.0,
+                "max_wait_s": round(self.wait_max, 4)
+            }
+
+
+def build_limiters(environ=os.environ):
+    # EMRA_LIMIT_<STAGE> / EMRA_TIMEOUT_<STAGE> override the defaults
+    limiters = {}
+    for stage, (limit, timeout) in STAGE_DEFAULTS.items():
+        limiters[stage] = StageLimiter(
+            stage,
+            int(environ.get(f"EMRA_LIMIT_{stage.upper()}", limit)),
+            float(environ.get(f"EMRA_TIMEOUT_{stage.upper()}", timeout))
+        )
+    return limiters
@@ -1,11 +1,20 @@
 import streamlit as st
+import altair as alt
 from pathlib import Path
 import joblib
 import numpy as np
 import pandas as pd
 import json
+import hashlib
+import hmac
+import html
+import os
+import tempfile
 import time
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Frame
+from reportlab.pdfgen import canvas as pdf_canvas
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics.charts.barcharts import VerticalBarChart
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
@@ -14,6 +23,40 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase import pdfmetrics
 from io import BytesIO
 from datetime import datetime
+from scipy.special import ndtr
+from contextlib import contextmanager
+from trajectory import record_visit
+from drift import DriftMonitor
+from admission import ServerBusy, build_limiters
+from metrics import Metrics, start_metrics_server
+from profiling import NULL_PROFILE, PROFILE_KEEP, list_profiles, profiled
+from result_cache import CACHE_DIR, CACHE_MAX_BYTES, DiskCache, cache_key
+from normalize import NORMALIZATION_SCHEMA, SOURCE_ROW, find_id_column, normalize_inputs
+from export import export_file
+from scoring import (
+    CATEGORY_BOUNDS,
+    measurement_uncertainty,
+    category_counterfactuals,
+    risk_surface,
+    load_feature_quantiles,
+    feature_population_percentiles,
+    FEATURE_QUANTILES_PATH,
+    CONTRIBUTION_QUANTILES_PATH,
+    CALIBRATION_PATH,
+    REFERENCE_BANDS_PATH,
+    STRATA_PATH,
+    GLOBAL_STRATUM,
+    load_stratified_reference,
+    resolve_strata,
+    stratified_percentiles,
+    stratum_scores,
+    contribution_percentiles,
+    load_calibration_table,
+    calibrated_probabilities,
+    load_reference_bands,
+    percentile_bands,
+    score_batch
+)
 
 # ======================================================
 # PAGE CONFIG
@@ -26,6 +69,104 @@ st.set_page_config(
 if "analysis_done" not in st.session_state:
     st.session_state.analysis_done = False
 
+# ======================================================
+# ADMISSION CONTROL (shared across sessions)
+# ======================================================
+
+@st.cache_resource
+def load_limiters():
+    return build_limiters()
+
+LIMITERS = load_limiters()
+
+@contextmanager
+def admitted(stage):
+    # Runs the block inside a stage slot; a full queue ends this run with a busy notice
+    try:
+        with LIMITERS[stage].slot():
+            yield
+    except ServerBusy as busy:
+        st.warning(
+            f"The server is busy right now ({busy.stage} queue full after "
+            f"{busy.waited:.0f}s). Please try again in a moment."
+        )
+        st.stop()
+
+# ======================================================
+# METRICS (Prometheus text format, shared across sessions)
+# ======================================================
+
+def active_sessions():
+    from streamlit.runtime import exists, get_instance
+    # No runtime when the script runs outside `streamlit run` (bare mode).
+    # _session_mgr is private Streamlit API; if a release moves it the
+    # gauge reads 0 instead of failing every scrape
+    if not exists():
+        return 0
+    try:
+        return get_instance()._session_mgr.num_active_sessions()
+    except Exception:
+        return 0
+
+@st.cache_resource
+def load_metrics():
+    # EMRA_METRICS_PORT=0 disables the endpoint; counters are still kept
+    metrics = Metrics()
+    metrics.describe("emra_requests_total", "Requests handled, by kind.")
+    metrics.describe("emra_cache_requests_total", "Cached computations requested, by cache.")
+    metrics.describe("emra_cache_misses_total", "Cached computations recomputed, by cache.")
+    metrics.describe("emra_stage_latency_seconds", "Wall time per pipeline stage.")
+    metrics.gauge("emra_active_sessions", active_sessions, "Connected browser sessions.")
+    metrics.gauge(
+        "emra_admission_active",
+        lambda: [({"stage": name}, limiter.active) for name, limiter in LIMITERS.items()],
+        "Requests currently holding a stage slot."
+    )
+    metrics.gauge(
+        "emra_admission_queued",
+        lambda: [({"stage": name}, limiter.waiting) for name, limiter in LIMITERS.items()],
+        "Requests waiting for a stage slot."
+    )
+    metrics.gauge(
+        "emra_admission_rejected",
+        lambda: [({"stage": name}, limiter.rejected) for name, limiter in LIMITERS.items()],
+        "Requests turned away with a busy notice since start."
+    )
+    metrics.gauge(
+        "emra_admission_mean_wait_seconds",
+        lambda: [({"stage": name}, limiter.stats()["mean_wait_s"]) for name, limiter in LIMITERS.items()],
+        "Mean time admitted requests waited for a stage slot since start."
+    )
+    metrics.gauge(
+        "emra_admission_max_wait_seconds",
+        lambda: [({"stage": name}, limiter.stats()["max_wait_s"]) for name, limiter in LIMITERS.items()],
+        "Longest time an admitted request waited for a stage slot since start."
+    )
+
+    port = int(os.environ.get("EMRA_METRICS_PORT", 9464))
+    if port:
+        start_metrics_server(metrics, os.environ.get("EMRA_METRICS_HOST", "127.0.0.1"), port)
+    return metrics
+
+METRICS = load_metrics()
+
+# serve.py warms each new replica with one assessment tagged ?warmup=1;
+# it is counted separately and kept out of the drift statistics
+WARMUP_RUN = st.query_params.get("warmup") == "1"
+
+# ======================================================
+# ON-DEMAND PROFILING
+# ======================================================
+# EMRA_PROFILE=1 profiles every request. Otherwise an admin opens the app
+# with ?profile=<EMRA_PROFILE_TOKEN> to profile that session's requests.
+
+PROFILE_TOKEN = os.environ.get("EMRA_PROFILE_TOKEN", "")
+PROFILE_KEEP_N = int(os.environ.get("EMRA_PROFILE_KEEP", PROFILE_KEEP))
+PROFILING = os.environ.get("EMRA_PROFILE") == "1" or (
+    bool(PROFILE_TOKEN)
+    and hmac.compare_digest(st.query_params.get("profile", ""), PROFILE_TOKEN)
+)
+
 # ======================================================
 # MODERN UI STYLES - NEUMORPHISM + GRADIENTS
 # ======================================================
@@ -570,8 +711,13 @@ def load_metadata():
     with open(META_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
+@st.cache_resource
+def file_version(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:12]
+
 model = load_model()
 metadata = load_metadata()
+MODEL_VERSION = file_version(MODEL_PATH)
 
 
 # ======================================================
@@ -584,17 +730,73 @@ def load_reference_scores():
     return np.load(REFERENCE_PATH)
 
 REFERENCE_SCORES = load_reference_scores()
+REFERENCE_VERSION = file_version(REFERENCE_PATH)
+
+# Optional age/sex strata (build_bundle.py --strata), memory-mapped
+@st.cache_resource
+def load_strata():
+    return load_stratified_reference(metadata.get("reference_strata"), REFERENCE_SCORES)
+
+STRATIFIED_REFERENCE = load_strata()
+
+METRICS.gauge(
+    "emra_model_info",
+    lambda versions={"model_version": MODEL_VERSION, "reference_version": REFERENCE_VERSION}: [(versions, 1)],
+    "Loaded model and reference population versions."
+)
 
 # ======================================================
 # CALIBRATION LAYER
 # ======================================================
 
-def score_to_percentile(score, reference_scores=REFERENCE_SCORES):
+def score_to_percentile(score, age=None, sex=None, reference_scores=REFERENCE_SCORES,
+                        strata=STRATIFIED_REFERENCE):
+    # With age and sex the subject is ranked within their stratum; everyone
+    # else (or a bundle without strata) against the global reference
+    if strata is not None and age is not None and sex is not None:
+        return int(stratified_percentiles(score, strata, resolve_strata(strata, age, sex))[0])
     pct = np.searchsorted(reference_scores, score, side="right") / len(reference_scores)
     pct = pct * 100
     pct = np.clip(pct, 20, 90)
     return int(round(pct))
 
+# Optional offline recalibration (build_bundle.py --calibration)
+@st.cache_resource
+def load_recalibration():
+    table = load_calibration_table()
+    if table is None:
+        return None
+    info = metadata.get("recalibration", {})
+    return {
+        "method": info.get("method", "unknown"),
+        "version": info.get("version", "unknown"),
+        "table": table
+    }
+
+RECALIBRATION = load_recalibration()
+
+# Bootstrap confidence bands for the percentile (build_bundle.py --bootstrap)
+@st.cache_resource
+def load_bands():
+    return load_reference_bands(metadata.get("reference_bands"), REFERENCE_VERSION, REFERENCE_SCORES)
+
+REFERENCE_BANDS = load_bands()
+
+def score_to_percentile_band(score, bands=REFERENCE_BANDS):
+    if bands is None:
+        return None
+    low, high = percentile_bands(score, REFERENCE_SCORES, bands)
+    return {"low": int(low), "high": int(high), "level": int(bands["level"])}
+
+def score_to_calibration(score, recalibration=RECALIBRATION):
+    if recalibration is None:
+        return None
+    return {
+        "probability": float(calibrated_probabilities(score, recalibration["table"])),
+        "method": recalibration["method"],
+        "version": recalibration["version"]
+    }
+
 # ======================================================
 # INTERPRETATION LAYER (ВАШ ОРИГИНАЛЬНЫЙ ТЕКСТ)
 # ======================================================
@@ -686,6 +888,12 @@ def percentile_to_demo_output(percentile: int) -> dict:
         }
 
 
+CATEGORY_LABELS = [
+    percentile_to_demo_output(int(bound))["category"]
+    for bound in (0, *CATEGORY_BOUNDS)
+]
+
+
 st.markdown('<div class="main-title">Early Metabolic Risk Assessment</div>', unsafe_allow_html=True)
 
 st.markdown("""
@@ -701,13 +909,47 @@ and is not intended for diagnosis or clinical decision-making.
 # ======================================================
 st.subheader("Enter biomarker values")
 
+INPUT_RANGES = {
+    "LBXGLU": (50.0, 200.0),
+    "LBXGH": (4.0, 10.0),
+    "LBXTR": (50.0, 400.0),
+    "BMXBMI": (15.0, 45.0)
+}
+
 col1, col2 = st.columns(2)
 with col1:
-    glucose = st.number_input("Fasting glucose (mg/dL)", 50.0, 200.0, 90.0)
-    hba1c   = st.number_input("HbA1c (%)", 4.0, 10.0, 5.4)
+    glucose = st.number_input("Fasting glucose (mg/dL)", *INPUT_RANGES["LBXGLU"], 90.0)
+    hba1c   = st.number_input("HbA1c (%)", *INPUT_RANGES["LBXGH"], 5.4)
 with col2:
-    tg      = st.number_input("Triglycerides (mg/dL)", 50.0, 400.0, 120.0)
-    bmi     = st.number_input("Body Mass Index (BMI)", 15.0, 45.0, 24.0)
+    tg      = st.number_input("Triglycerides (mg/dL)", *INPUT_RANGES["LBXTR"], 120.0)
+    bmi     = st.number_input("Body Mass Index (BMI)", *INPUT_RANGES["BMXBMI"], 24.0)
+
+age = sex = None
+if STRATIFIED_REFERENCE is not None:
+    col3, col4 = st.columns(2)
+    age = col3.number_input(
+        "Age (optional)", 0, 120, None, 1,
+        help="With age and sex, the percentile is computed within the matching age/sex group."
+    )
+    sex = col4.selectbox(
+        "Sex (optional)",
+        range(len(STRATIFIED_REFERENCE["sex_labels"])),
+        index=None,
+        format_func=lambda i: STRATIFIED_REFERENCE["sex_labels"][i].capitalize()
+    )
+    if sex is not None:
+        sex = float(STRATIFIED_REFERENCE["sex_codes"][sex])
+
+subject_id = st.text_input(
+    "Subject ID (optional)",
+    "",
+    help="Re-tested subjects are tracked across visits when an ID is given."
+).strip()
+
+show_uncertainty = st.checkbox(
+    "Include measurement uncertainty",
+    help="Perturbs each biomarker by its typical analytical variation and reports a percentile interval."
+)
 
 # ======================================================
 # EXTRACT PIPELINE COMPONENTS
@@ -721,6 +963,27 @@ weights = logreg.coef_[0]
 intercept = logreg.intercept_[0]
 feature_names = metadata["features"]
 
+# ======================================================
+# DRIFT MONITOR (shared across sessions)
+# ======================================================
+
+@st.cache_resource
+def load_drift_monitor():
+    return DriftMonitor(
+        REFERENCE_SCORES,
+        feature_names,
+        scaler.mean_,
+        scaler.scale_,
+        feature_quantiles=load_feature_quantiles(feature_names),
+        psi_threshold=float(os.environ.get("EMRA_DRIFT_PSI", 0.2)),
+        ks_threshold=float(os.environ.get("EMRA_DRIFT_KS", 0.1)),
+        z_mean_threshold=float(os.environ.get("EMRA_DRIFT_Z_MEAN", 0.5)),
+        z_std_ratio=float(os.environ.get("EMRA_DRIFT_Z_STD", 1.5)),
+        min_count=int(os.environ.get("EMRA_DRIFT_MIN_COUNT", 100))
+    )
+
+drift_monitor = load_drift_monitor()
+
 # =====================================
 # HUMAN-READABLE FEATURE LABELS
 # =====================================
@@ -732,28 +995,143 @@ FEATURE_LABELS = {
     "BMXBMI": "Body Mass Index"
 }
 
+FEATURE_UNITS = {
+    "LBXGLU": "mg/dL",
+    "LBXGH": "%",
+    "LBXTR": "mg/dL",
+    "BMXBMI": "kg/m²"
+}
+
 # ======================================================
-# Z-SCORE INTERPRETATION (Population Deviation)
+# COUNTERFACTUAL THRESHOLDS
 # ======================================================
 
-def interpret_z_score(z):
+def counterfactual_rows(cf, subject, category_code):
+
+    rows = []
+
+    for j, name in enumerate(feature_names):
 
-    abs_z = abs(z)
+        row = {
+            "feature": name,
+            "current": float(cf["values"][subject, j]),
+            "lower": None,
+            "upper": None
+        }
+
+        # Band below: stay under its upper bound; band above: reach its lower bound
+        for key, bound_index, target_code in (
+            ("lower", category_code - 1, category_code - 1),
+            ("upper", category_code, category_code + 1)
+        ):
+            if 0 <= bound_index < len(CATEGORY_BOUNDS):
+                value = float(cf["target"][subject, bound_index, j])
+                low, high = INPUT_RANGES[name]
+                row[key] = {
+                    "value": value,
+                    "category": CATEGORY_LABELS[target_code],
+                    "in_range": low <= value <= high
+                }
 
-    if abs_z < 0.5:
+        rows.append(row)
+
+    return rows
+
+
+def format_counterfactual(name, target):
+    if target is None:
+        return "—"
+    text = f"{target['value']:.1f} {FEATURE_UNITS.get(name, '')}".strip()
+    return text if target["in_range"] else f"{text} (outside input range)"
+
+# ======================================================
+# POPULATION PERCENTILE INTERPRETATION (Population Deviation)
+# ======================================================
+
+@st.cache_resource
+def load_quantile_table():
+    return load_feature_quantiles(feature_names)
+
+@st.cache_resource
+def load_contribution_table():
+    return load_feature_quantiles(feature_names, CONTRIBUTION_QUANTILES_PATH)
+
+FEATURE_QUANTILES = load_quantile_table()
+CONTRIBUTION_QUANTILES = load_contribution_table()
+
+# Without the empirical table the percentile is only the z-score mapped
+# through a normal CDF, which is off for skewed markers (triglycerides),
+# so it is labelled as an estimate
+EMPIRICAL_PERCENTILES = FEATURE_QUANTILES is not None
+PERCENTILE_LABEL = "population percentile" if EMPIRICAL_PERCENTILES else "z-score percentile estimate"
+
+PERCENTILE_ESTIMATE_NOTE = (
+    "Percentiles here are estimated from z-scores assuming a normal distribution, "
+    "not read from the population's empirical distribution; they are approximate, "
+    "especially for skewed markers such as triglycerides."
+)
+
+# Tail mass matching |z| = 0.5 / 1 / 2 under a normal distribution
+DEVIATION_TAILS = tuple(ndtr(-np.array([0.5, 1, 2])) * 100)
+
+DEVIATION_COLORS = ["#6b7280", "#f59e0b", "#ef4444", "#7c2d12"]
+
+def interpret_population_percentile(pct):
+
+    tail = min(pct, 100 - pct)
+    above = pct > 50
+
+    if tail >= DEVIATION_TAILS[0]:
+        severity = 0
         level = "within normal population range"
-    elif abs_z < 1:
-        level = "slightly above population average" if z > 0 else "slightly below population average"
-    elif abs_z < 2:
-        level = "moderately elevated above average" if z > 0 else "moderately below average"
+    elif tail >= DEVIATION_TAILS[1]:
+        severity = 1
+        level = "slightly above population average" if above else "slightly below population average"
+    elif tail >= DEVIATION_TAILS[2]:
+        severity = 2
+        level = "moderately elevated above average" if above else "moderately below average"
     else:
-        level = "significantly elevated above average" if z > 0 else "significantly below average"
+        severity = 3
+        level = "significantly elevated above average" if above else "significantly below average"
 
-    direction = "above" if z > 0 else "below"
+    direction = "above" if above else "below"
 
-    return level, direction
+    return level, direction, severity
+
+# ======================================================
+# SHARED PDF RESOURCES
+# ======================================================
+# One stylesheet and one table template, shared by the single-subject
+# and cohort reports instead of being rebuilt for every PDF.
+
+@st.cache_resource
+def load_pdf_resources():
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 0), (-1, -1), 10),
+    ])
+    return styles, table_style
 
-def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
+PDF_STYLES, PDF_TABLE_STYLE = load_pdf_resources()
+
+PDF_DISCLAIMER = (
+    "Percentiles are computed relative to a fixed reference population used during model validation. "
+    "This output reflects population-level statistical patterns and is intended for research and "
+    "exploratory purposes only. It does not represent an individual diagnosis or prediction."
+)
+
+def pdf_table(rows, col_widths, extra_style=None):
+    table = Table(rows, colWidths=col_widths)
+    table.setStyle(PDF_TABLE_STYLE)
+    if extra_style:
+        table.setStyle(TableStyle(extra_style))
+    return table
+
+def generate_pdf_report(percentile, demo, explain_data, inputs, source_url, trajectory=None, uncertainty=None,
+                        counterfactuals=None, calibration=None, percentile_band=None, reference_group=None):
 
     buffer = BytesIO()
     doc = SimpleDocTemplate(
@@ -766,7 +1144,7 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     )
 
     elements = []
-    styles = getSampleStyleSheet()
+    styles = PDF_STYLES
 
     # Custom styles
     title_style = styles["Heading1"]
@@ -797,8 +1175,39 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     elements.append(Spacer(1, 0.2 * inch))
 
     elements.append(Paragraph(f"Risk Percentile: {percentile}", normal_style))
+
+    if reference_group is not None:
+        elements.append(Paragraph(f"Reference group: {reference_group}", normal_style))
+
+    if percentile_band is not None:
+        elements.append(Paragraph(
+            f"Reference sampling uncertainty ({percentile_band['level']}% bootstrap band): "
+            f"{percentile_band['low']}–{percentile_band['high']}",
+            normal_style
+        ))
     elements.append(Paragraph(f"Risk Category: {demo['category']}", normal_style))
 
+    if calibration is not None:
+        elements.append(Paragraph(
+            f"Calibrated probability: {calibration['probability'] * 100:.1f}% "
+            f"({calibration['method']} recalibration, version {calibration['version']})",
+            normal_style
+        ))
+
+    if uncertainty is not None:
+        elements.append(Paragraph(
+            f"Measurement uncertainty ({uncertainty['interval'][1] - uncertainty['interval'][0]}% interval, "
+            f"{uncertainty['n_samples']} samples): percentile {uncertainty['low']}–{uncertainty['high']}",
+            normal_style
+        ))
+        elements.append(Paragraph(
+            "Category probabilities: " + "; ".join(
+                f"{label} {prob * 100:.0f}%"
+                for label, prob in uncertainty["category_probs"].items()
+            ),
+            normal_style
+        ))
+
     elements.append(Spacer(1, 0.4 * inch))
 
     # ===============================
@@ -812,14 +1221,11 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     for name, value in inputs.items():
         biomarker_table.append([name, value])
 
-    table = Table(biomarker_table, colWidths=[3.2 * inch, 2 * inch])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 0), (-1, -1), 10),
-        ("ALIGN", (1, 1), (-1, -1), "RIGHT")
-    ]))
+    table = pdf_table(
+        biomarker_table,
+        [3.2 * inch, 2 * inch],
+        [("ALIGN", (1, 1), (-1, -1), "RIGHT")]
+    )
 
     elements.append(table)
     elements.append(Spacer(1, 0.4 * inch))
@@ -831,23 +1237,28 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     elements.append(Paragraph("Model Contribution Analysis", section_style))
     elements.append(Spacer(1, 0.2 * inch))
 
+    has_rank = any(item.get("contribution_rank") is not None for item in explain_data)
+
     contrib_table = [["Biomarker", "Contribution", "Direction"]]
+    if has_rank:
+        contrib_table[0].append("Reference percentile")
 
     for item in explain_data:
         direction_text = "Risk-increasing" if item["direction"] == "increase" else "Risk-reducing"
-        contrib_table.append([
+        row = [
             FEATURE_LABELS.get(item["feature"], item["feature"]),
             f"{item['percent']}%",
             direction_text
-        ])
-
-    contrib = Table(contrib_table, colWidths=[2.8 * inch, 1 * inch, 1.4 * inch])
-    contrib.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 0), (-1, -1), 10),
-    ]))
+        ]
+        if has_rank:
+            row.append(f"{item['contribution_rank']:.0f}")
+        contrib_table.append(row)
+
+    contrib = pdf_table(
+        contrib_table,
+        [2.2 * inch, 1 * inch, 1.4 * inch, 1.2 * inch] if has_rank
+        else [2.8 * inch, 1 * inch, 1.4 * inch]
+    )
 
     elements.append(contrib)
     elements.append(Spacer(1, 0.4 * inch))
@@ -859,25 +1270,91 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     elements.append(Paragraph("Population Deviation Analysis", section_style))
     elements.append(Spacer(1, 0.2 * inch))
 
-    deviation_table = [["Biomarker", "Deviation (σ)"]]
+    deviation_table = [["Biomarker", PERCENTILE_LABEL.capitalize(), "Deviation (σ)", "Level"]]
 
     for item in explain_data:
         deviation_table.append([
             FEATURE_LABELS.get(item["feature"], item["feature"]),
-            f"{item['z_score']} σ"
+            f"{item['population_percentile']:.0f}",
+            f"{item['z_score']} σ",
+            Paragraph(item["deviation_level"], normal_style)
         ])
 
-    deviation = Table(deviation_table, colWidths=[3.2 * inch, 2 * inch])
-    deviation.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 0), (-1, -1), 10),
-    ]))
+    deviation = pdf_table(deviation_table, [1.6 * inch, 1.3 * inch, 1.1 * inch, 2 * inch])
 
     elements.append(deviation)
+    if not EMPIRICAL_PERCENTILES:
+        elements.append(Spacer(1, 0.1 * inch))
+        elements.append(Paragraph(PERCENTILE_ESTIMATE_NOTE, normal_style))
     elements.append(Spacer(1, 0.4 * inch))
 
+    # ===============================
+    # COUNTERFACTUAL THRESHOLDS
+    # ===============================
+
+    if counterfactuals is not None:
+
+        elements.append(Paragraph("What Would Change the Category", section_style))
+        elements.append(Spacer(1, 0.2 * inch))
+
+        elements.append(Paragraph(
+            "Value of each biomarker, others held fixed, at which the profile "
+            "crosses into the neighbouring category.",
+            normal_style
+        ))
+        elements.append(Spacer(1, 0.1 * inch))
+
+        cf_table = [["Biomarker", "Lower category below", "Higher category from"]]
+
+        for row in counterfactuals:
+            cf_table.append([
+                FEATURE_LABELS.get(row["feature"], row["feature"]),
+                format_counterfactual(row["feature"], row["lower"]),
+                format_counterfactual(row["feature"], row["upper"])
+            ])
+
+        cf = pdf_table(
+            cf_table,
+            [1.8 * inch, 2.1 * inch, 2.1 * inch],
+            [("FONTSIZE", (0, 0), (-1, -1), 9)]
+        )
+
+        elements.append(cf)
+        elements.append(Spacer(1, 0.4 * inch))
+
+    # ===============================
+    # LONGITUDINAL TRAJECTORY
+    # ===============================
+
+    if trajectory is not None and trajectory["n_visits"] > 1:
+
+        elements.append(Paragraph("Longitudinal Trajectory", section_style))
+        elements.append(Spacer(1, 0.2 * inch))
+
+        transition = trajectory["category_transition"]
+        top_mover = trajectory["top_mover"]
+
+        trajectory_table = [
+            ["Visits recorded", str(trajectory["n_visits"])],
+            ["Change since previous visit", f"{trajectory['percentile_change']:+d} percentile points"],
+            ["Change since first visit", f"{trajectory['total_change']:+d} percentile points"],
+            ["Category transition",
+             f"{transition['from']} → {transition['to']}" if transition else "No change"],
+            ["Largest contribution shift",
+             f"{FEATURE_LABELS.get(top_mover['feature'], top_mover['feature'])} "
+             f"({top_mover['delta']:+.2f})" if top_mover else "—"]
+        ]
+
+        traj = Table(trajectory_table, colWidths=[3.2 * inch, 2.6 * inch])
+        traj.setStyle(TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 10),
+        ]))
+
+        elements.append(traj)
+        elements.append(Spacer(1, 0.4 * inch))
+
     # ===============================
     # INTERPRETATION
     # ===============================
@@ -893,12 +1370,7 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     # DISCLAIMER
     # ===============================
 
-    elements.append(Paragraph(
-        "Percentiles are computed relative to a fixed reference population used during model validation. "
-        "This output reflects population-level statistical patterns and is intended for research and "
-        "exploratory purposes only. It does not represent an individual diagnosis or prediction.",
-        normal_style
-    ))
+    elements.append(Paragraph(PDF_DISCLAIMER, normal_style))
 
     doc.build(elements)
     buffer.seek(0)
@@ -906,94 +1378,427 @@ def generate_pdf_report(percentile, demo, explain_data, inputs, source_url):
     return buffer
 
 # ======================================================
-# RUN ANALYSIS
+# COHORT PDF REPORT
 # ======================================================
+# Summary page followed by one compact page per subject. Pages are laid
+# out one at a time on the canvas (Frame.addFromList + showPage), so only
+# the current page's flowables exist at any point.
+
+# Every subject gets a page. ReportLab keeps each finished page in memory
+# until save(), so peak memory grows linearly at about 8 KB per subject
+# page (~10 MB per 1k subjects, ~80 MB for 10k measured). Deployments that
+# need a hard cap can set EMRA_COHORT_PDF_MAX to write only the first N
+# subject pages; the summary page always covers the whole cohort and the
+# CSV/XLSX exports always have every row.
+COHORT_REPORT_MAX_SUBJECTS = int(os.environ.get("EMRA_COHORT_PDF_MAX", 0)) or None
+
+def _cohort_summary_page(results, source_url, max_subjects=COHORT_REPORT_MAX_SUBJECTS):
+
+    title_style = PDF_STYLES["Heading1"]
+    section_style = PDF_STYLES["Heading2"]
+    normal_style = PDF_STYLES["Normal"]
+
+    percentiles = results["percentile"].to_numpy()
+
+    elements = [
+        Paragraph("EARLY METABOLIC RISK ASSESSMENT — COHORT REPORT", title_style),
+        Paragraph(
+            f"Research Demonstration Report<br/>"
+            f"Generated: {datetime.now().strftime('%d %b %Y')}<br/>"
+            f"Source: {source_url}<br/>"
+            f"Subjects: {len(results)} · median percentile {np.median(percentiles):.0f}",
+            normal_style
+        ),
+        Spacer(1, 0.2 * inch),
+        Paragraph("Percentile Distribution", section_style)
+    ]
+
+    bins = np.arange(20, 95, 5)
+    counts, _ = np.histogram(percentiles, bins=np.append(bins, 91))
+
+    chart_drawing = Drawing(6.5 * inch, 2 * inch)
+    chart = VerticalBarChart()
+    chart.x, chart.y = 30, 20
+    chart.width, chart.height = 6.5 * inch - 40, 2 * inch - 30
+    chart.data = [counts.tolist()]
+    chart.categoryAxis.categoryNames = [str(b) for b in bins]
+    chart.valueAxis.valueMin = 0
+    chart.bars[0].fillColor = colors.HexColor("#667eea")
+    chart_drawing.add(chart)
+    elements += [chart_drawing, Spacer(1, 0.2 * inch)]
+
+    elements.append(Paragraph("Category Counts", section_style))
+    codes = results["category_code"].to_numpy()
+    category_rows = [["Category", "Subjects", "Share"]]
+    for code, label in enumerate(CATEGORY_LABELS):
+        n = int((codes == code).sum())
+        category_rows.append([label, str(n), f"{n / max(len(results), 1) * 100:.1f}%"])
+    elements += [pdf_table(category_rows, [3.6 * inch, 1 * inch, 1 * inch]), Spacer(1, 0.2 * inch)]
+
+    elements.append(Paragraph("Average Contributions", section_style))
+    contribution_rows = [["Biomarker", "Mean share", "Mean value"]]
+    for name in feature_names:
+        contribution_rows.append([
+            FEATURE_LABELS.get(name, name),
+            f"{results[f'share_{name}'].mean():.1f}%",
+            f"{results[name].mean():.1f} {FEATURE_UNITS.get(name, '')}"
+        ])
+    elements += [pdf_table(contribution_rows, [2.8 * inch, 1.4 * inch, 1.4 * inch]), Spacer(1, 0.3 * inch)]
 
-if st.button("Assess metabolic pattern"):
-    st.session_state.analysis_done = True
+    if max_subjects is not None and len(results) > max_subjects:
+        elements.append(Paragraph(
+            f"Subject pages are included for the first {max_subjects} of {len(results)} subjects; "
+            f"the CSV / Excel export lists every subject with the same label.",
+            normal_style
+        ))
+        elements.append(Spacer(1, 0.2 * inch))
+
+    elements.append(Paragraph(PDF_DISCLAIMER, normal_style))
+    return elements
+
+
+def _cohort_subject_page(subject_label, row, interpretations):
+
+    section_style = PDF_STYLES["Heading2"]
+    normal_style = PDF_STYLES["Normal"]
+    demo = interpretations[row["category_code"]]
+
+    biomarker_rows = [["Biomarker", "Value", "Contribution"]]
+    for name in feature_names:
+        value = row[name]
+        biomarker_rows.append([
+            FEATURE_LABELS.get(name, name),
+            "imputed" if pd.isna(value) else f"{value:.1f} {FEATURE_UNITS.get(name, '')}",
+            f"{row[f'share_{name}']:.1f}%"
+        ])
+
+    return [
+        # Paragraph text is markup; IDs from an uploaded CSV are escaped like the UI's subject ID
+        Paragraph(f"Subject {html.escape(str(subject_label))}", section_style),
+        Paragraph(f"Risk Percentile: {row['percentile']}", normal_style),
+        Paragraph(f"Risk Category: {demo['category']}", normal_style),
+        Spacer(1, 0.2 * inch),
+        pdf_table(biomarker_rows, [2.8 * inch, 1.6 * inch, 1.2 * inch], [("ALIGN", (1, 1), (-1, -1), "RIGHT")]),
+        Spacer(1, 0.2 * inch),
+        Paragraph(demo["interpretation"], normal_style)
+    ]
+
+
+def generate_cohort_report(results, target, source_url, interpretations, id_column=None,
+                           max_subjects=COHORT_REPORT_MAX_SUBJECTS):
+
+    width, height = A4
+    c = pdf_canvas.Canvas(target, pagesize=A4, pageCompression=1)
+
+    def draw_page(elements):
+        Frame(40, 40, width - 80, height - 90).addFromList(elements, c)
+        c.showPage()
+
+    draw_page(_cohort_summary_page(results, source_url, max_subjects))
 
-    with st.spinner('Analyzing metabolic patterns...'):
-        time.sleep(1)
+    if id_column == SOURCE_ROW:
+        labels = "row " + results[SOURCE_ROW].astype(str)
+    elif id_column and SOURCE_ROW in results:
+        labels = results[id_column].astype(str) + " (row " + results[SOURCE_ROW].astype(str) + ")"
+    elif id_column:
+        labels = results[id_column]
+    else:
+        labels = pd.Series(range(1, len(results) + 1), index=results.index)
+    subjects = results if max_subjects is None else results.head(max_subjects)
+    for label, (_, row) in zip(labels, subjects.iterrows()):
+        draw_page(_cohort_subject_page(label, row, interpretations))
+
+    c.save()
+    return target
+
+
+def cohort_report_file(results, source_url, interpretations, id_column=None):
+    # Same hand-off as export.export_file: built on disk, returned as a reader
+    handle, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(handle)
+    try:
+        generate_cohort_report(results, path, source_url, interpretations, id_column)
+        return open(path, "rb")
+    finally:
+        os.unlink(path)
+
+# ======================================================
+# RESULT CACHE (on disk, shared across sessions and replicas)
+# ======================================================
+# EMRA_CACHE_MAX_MB=0 disables it. Bump CACHE_SCHEMA whenever the shape
+# of a cached assessment or the PDF layout changes.
+
+CACHE_SCHEMA = 5
+
+def optional_file_version(path):
+    return file_version(path) if Path(path).exists() else None
+
+BUNDLE_VERSIONS = {
+    "model": MODEL_VERSION,
+    "metadata": file_version(META_PATH),
+    "reference": REFERENCE_VERSION,
+    "feature_quantiles": optional_file_version(FEATURE_QUANTILES_PATH),
+    "contribution_quantiles": optional_file_version(CONTRIBUTION_QUANTILES_PATH),
+    "calibration": optional_file_version(CALIBRATION_PATH),
+    "reference_bands": optional_file_version(REFERENCE_BANDS_PATH),
+    "strata": optional_file_version(STRATA_PATH)
+}
+
+@st.cache_resource
+def load_result_cache():
+    return DiskCache(
+        os.environ.get("EMRA_CACHE_DIR", CACHE_DIR),
+        int(float(os.environ.get("EMRA_CACHE_MAX_MB", CACHE_MAX_BYTES / 1024 / 1024)) * 1024 * 1024)
+    )
 
-        user_df = pd.DataFrame([{
-            "LBXGLU": glucose,
-            "LBXGH": hba1c,
-            "LBXTR": tg,
-            "BMXBMI": bmi
-        }])
+RESULT_CACHE = load_result_cache()
 
-        # MODEL PREDICTION
+def disk_cache_get(key, kind, raw=False):
+    if not RESULT_CACHE.enabled:
+        return None
+    METRICS.inc("emra_cache_requests_total", cache=f"disk_{kind}")
+    value = RESULT_CACHE.get_bytes(key, kind) if raw else RESULT_CACHE.get(key, kind)
+    if value is None:
+        METRICS.inc("emra_cache_misses_total", cache=f"disk_{kind}")
+    return value
+
+# ======================================================
+# ASSESSMENT
+# ======================================================
+# Everything here depends only on the four inputs and the model bundle,
+# so the result is cached on disk (see RESULT_CACHE) and shared by all
+# replicas on the host.
+
+def compute_assessment(user_df, with_uncertainty, age=None, sex=None, profile=NULL_PROFILE):
+
+    # Subjects without age/sex, or without a stratified bundle, stay on the global reference
+    segment = GLOBAL_STRATUM
+    if STRATIFIED_REFERENCE is not None and age is not None and sex is not None:
+        segment = int(resolve_strata(STRATIFIED_REFERENCE, age, sex)[0])
+    if segment == GLOBAL_STRATUM:
+        reference_scores = REFERENCE_SCORES
+        reference_group = None
+    else:
+        reference_scores = stratum_scores(STRATIFIED_REFERENCE, segment)
+        reference_group = STRATIFIED_REFERENCE["labels"][segment]
+
+    # MODEL PREDICTION
+    with METRICS.timer("inference"):
         raw_score = model.predict_proba(user_df)[0, 1]
+    profile.lap("inference")
 
-        # =============================
-        # EXPLAINABILITY CALCULATION
-        # =============================
+    # =============================
+    # EXPLAINABILITY CALCULATION
+    # =============================
 
-        imputed = imputer.transform(user_df)
-        scaled = scaler.transform(imputed)
-        scaled_values = scaled[0]
+    explain_start = time.perf_counter()
 
-        raw_contributions = weights * scaled_values
-        abs_contributions = np.abs(raw_contributions)
+    imputed = imputer.transform(user_df)
+    scaled = scaler.transform(imputed)
+    scaled_values = scaled[0]
 
-        total = abs_contributions.sum()
+    raw_contributions = weights * scaled_values
+    abs_contributions = np.abs(raw_contributions)
 
-        if total != 0:
-            contribution_percent = abs_contributions / total * 100
-        else:
-            contribution_percent = np.zeros_like(abs_contributions)
+    total = abs_contributions.sum()
 
-        explain_data = []
+    if total != 0:
+        contribution_percent = abs_contributions / total * 100
+    else:
+        contribution_percent = np.zeros_like(abs_contributions)
 
-        for name, pct, raw, z in zip(
-            feature_names,
-            contribution_percent,
-            raw_contributions,
-            scaled_values
-        ):
+    population_percentiles = feature_population_percentiles(
+        model, imputed, FEATURE_QUANTILES
+    )[0]
 
-            direction = "increase" if raw > 0 else "decrease"
+    contribution_ranks = contribution_percentiles(
+        contribution_percent[None, :], CONTRIBUTION_QUANTILES
+    )
+    if contribution_ranks is None:
+        contribution_ranks = [None] * len(feature_names)
+    else:
+        contribution_ranks = [round(float(rank), 1) for rank in contribution_ranks[0]]
+
+    explain_data = []
+
+    for name, pct, raw, z, pop_pct, rank in zip(
+        feature_names,
+        contribution_percent,
+        raw_contributions,
+        scaled_values,
+        population_percentiles,
+        contribution_ranks
+    ):
 
-            level, z_direction = interpret_z_score(z)
+        direction = "increase" if raw > 0 else "decrease"
 
+        level, pop_direction, severity = interpret_population_percentile(pop_pct)
+
+        if EMPIRICAL_PERCENTILES:
             deviation_text = (
                 f"{FEATURE_LABELS.get(name, name)} "
-                f"is {z_direction} population mean by {abs(round(float(z),2))} σ"
+                f"is at population percentile {pop_pct:.0f} "
+                f"({'above' if z > 0 else 'below'} mean by {abs(round(float(z),2))} σ)"
+            )
+        else:
+            deviation_text = (
+                f"{FEATURE_LABELS.get(name, name)} "
+                f"is {abs(round(float(z),2))} σ {'above' if z > 0 else 'below'} the mean "
+                f"(z-score percentile estimate {pop_pct:.0f})"
             )
 
-            explain_data.append({
-                "feature": name,
-                "percent": round(float(pct), 1),
-                "raw": float(raw),
-                "direction": direction,
-                "z_score": round(float(z), 2),
-                "deviation_text": deviation_text,
-                "deviation_level": level
-            })
-
-        explain_data = sorted(
-            explain_data,
-            key=lambda x: x["percent"],
-            reverse=True
-        )
+        explain_data.append({
+            "feature": name,
+            "percent": round(float(pct), 1),
+            "contribution_rank": rank,
+            "raw": float(raw),
+            "direction": direction,
+            "z_score": round(float(z), 2),
+            "population_percentile": round(float(pop_pct), 1),
+            "deviation_text": deviation_text,
+            "deviation_level": level,
+            "deviation_severity": severity
+        })
+
+    explain_data = sorted(
+        explain_data,
+        key=lambda x: x["percent"],
+        reverse=True
+    )
 
-        percentile = score_to_percentile(raw_score)
+    METRICS.observe("explain", time.perf_counter() - explain_start)
+    profile.lap("explain")
+
+    with METRICS.timer("percentile"):
+        percentile = score_to_percentile(raw_score, age, sex)
         demo = percentile_to_demo_output(percentile)
+        calibration = score_to_calibration(raw_score)
+        # Bootstrap bands are built for the global reference only
+        percentile_band = score_to_percentile_band(raw_score) if reference_group is None else None
+    profile.lap("percentile")
+
+    counterfactuals = counterfactual_rows(
+        category_counterfactuals(model, user_df[feature_names].to_numpy(), reference_scores),
+        0,
+        CATEGORY_LABELS.index(demo["category"])
+    )
+    profile.lap("counterfactuals")
 
-    # ==================================================
-    # VISUAL RESULT
-    # ==================================================
+    # =============================
+    # MEASUREMENT UNCERTAINTY
+    # =============================
 
-    if demo['card_class'] == 'low':
-        ring_color = '#10b981'
-    elif demo['card_class'] == 'borderline':
-        ring_color = '#f59e0b'
-    else:
-        ring_color = '#ef4444'
+    uncertainty = None
 
-    dashoffset = 565 - (percentile / 100 * 565)
+    if with_uncertainty:
+        mc = measurement_uncertainty(
+            model,
+            user_df[feature_names].to_numpy(),
+            feature_names,
+            reference_scores
+        )
+        uncertainty = {
+            "interval": mc["interval"],
+            "n_samples": mc["n_samples"],
+            "low": int(mc["low"][0]),
+            "high": int(mc["high"][0]),
+            "category_probs": dict(zip(CATEGORY_LABELS, mc["category_probs"][0].tolist()))
+        }
+    profile.lap("uncertainty")
+
+    return {
+        "raw_score": float(raw_score),
+        "raw_contributions": [float(raw) for raw in raw_contributions],
+        "explain_data": explain_data,
+        "percentile": percentile,
+        "calibration": calibration,
+        "percentile_band": percentile_band,
+        "reference_group": reference_group,
+        "counterfactuals": counterfactuals,
+        "uncertainty": uncertainty
+    }
+
+# ======================================================
+# RUN ANALYSIS
+# ======================================================
 
-    st.markdown(f"""
+if st.button("Assess metabolic pattern"):
+    with profiled("assessment", PROFILING, keep=PROFILE_KEEP_N) as profile:
+        st.session_state.analysis_done = True
+        METRICS.inc("emra_requests_total", kind="warmup" if WARMUP_RUN else "assessment")
+
+        with st.spinner('Analyzing metabolic patterns...'):
+            time.sleep(1)
+        profile.lap("spinner")
+
+        with st.spinner('Analyzing metabolic patterns...'), admitted("inference"):
+            user_df = pd.DataFrame([{
+                "LBXGLU": glucose,
+                "LBXGH": hba1c,
+                "LBXTR": tg,
+                "BMXBMI": bmi
+            }])
+
+            # Warm-up runs bypass the cache so they always exercise the model
+            assessment_key = cache_key(
+                "assessment", CACHE_SCHEMA, BUNDLE_VERSIONS,
+                user_df.iloc[0][feature_names].tolist(), show_uncertainty, age, sex
+            )
+            assessment = None if WARMUP_RUN else disk_cache_get(assessment_key, "assessment")
+            if assessment is None:
+                assessment = compute_assessment(user_df, show_uncertainty, age, sex, profile)
+                if not WARMUP_RUN:
+                    RESULT_CACHE.put(assessment_key, "assessment", assessment)
+
+            raw_score = assessment["raw_score"]
+            raw_contributions = assessment["raw_contributions"]
+            explain_data = assessment["explain_data"]
+            percentile = assessment["percentile"]
+            demo = percentile_to_demo_output(percentile)
+            calibration = assessment["calibration"]
+            percentile_band = assessment["percentile_band"]
+            reference_group = assessment["reference_group"]
+            counterfactuals = assessment["counterfactuals"]
+            uncertainty = assessment["uncertainty"]
+
+            if not WARMUP_RUN:
+                drift_monitor.update(user_df[feature_names].to_numpy(), raw_score)
+
+            # =============================
+            # LONGITUDINAL TRACKING
+            # =============================
+
+            trajectory = None
+
+            if subject_id:
+                trajectory = record_visit(subject_id, {
+                    "visited_at": datetime.now().isoformat(timespec="seconds"),
+                    "percentile": percentile,
+                    "category": demo["category"],
+                    "inputs": user_df.iloc[0].to_dict(),
+                    "contributions": {
+                        name: float(raw)
+                        for name, raw in zip(feature_names, raw_contributions)
+                    }
+                })
+            profile.lap("trajectory")
+
+        render_start = time.perf_counter()
+
+        # ==================================================
+        # VISUAL RESULT
+        # ==================================================
+
+        if demo['card_class'] == 'low':
+            ring_color = '#10b981'
+        elif demo['card_class'] == 'borderline':
+            ring_color = '#f59e0b'
+        else:
+            ring_color = '#ef4444'
+
+        dashoffset = 565 - (percentile / 100 * 565)
+
+        st.markdown(f"""
     <div class="percent-container">
         <div class="percent-value">{percentile}</div>
         <div class="progress-ring">
@@ -1006,22 +1811,75 @@ if st.button("Assess metabolic pattern"):
     </div>
     """, unsafe_allow_html=True)
 
-    # ==================================================
-    # FEATURE CONTRIBUTIONS
-    # ==================================================
+        if percentile_band is not None:
+            st.markdown(
+                f'<p style="text-align:center; color:#6b7280; font-size:0.9rem; margin-bottom:0;">'
+                f'{percentile_band["level"]}% reference band: {percentile_band["low"]}–{percentile_band["high"]}</p>',
+                unsafe_allow_html=True
+            )
+
+        if reference_group is not None:
+            st.markdown(
+                f'<p style="text-align:center; color:#6b7280; font-size:0.9rem; margin-bottom:0;">'
+                f'Compared with: {reference_group}</p>',
+                unsafe_allow_html=True
+            )
+
+        if calibration is not None:
+            st.markdown(
+                f'<p style="text-align:center; color:#6b7280; font-size:0.9rem;">'
+                f'Calibrated probability {calibration["probability"] * 100:.1f}% · '
+                f'{calibration["method"]} recalibration v{calibration["version"]}</p>',
+                unsafe_allow_html=True
+            )
 
-    st.markdown("""
+        # ==================================================
+        # MEASUREMENT UNCERTAINTY
+        # ==================================================
+
+        if uncertainty is not None:
+
+            probability_rows = "".join(
+                f'<div style="display:flex; justify-content:space-between;">'
+                f'<span>{label}</span><span>{prob * 100:.0f}%</span></div>'
+                for label, prob in uncertainty["category_probs"].items()
+            )
+
+            st.markdown(f"""
+<div class="deviation-card">
+    <div class="deviation-title">
+        Percentile range under measurement variation: {uncertainty['low']}–{uncertainty['high']}
+    </div>
+    <div style="font-size:0.9rem; color:#6b7280;">
+        {uncertainty['interval'][1] - uncertainty['interval'][0]}% interval from {uncertainty['n_samples']} simulated re-measurements
+        {probability_rows}
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+        # ==================================================
+        # FEATURE CONTRIBUTIONS
+        # ==================================================
+
+        st.markdown("""
     <div style="margin-top:2rem;">
     <strong style="font-size:1.1rem;">Feature Contributions</strong>
     </div>
     """, unsafe_allow_html=True)
 
-    for item in explain_data:
+        for item in explain_data:
 
-        color = "#ef4444" if item["direction"] == "increase" else "#10b981"
-        arrow = "↑" if item["direction"] == "increase" else "↓"
+            color = "#ef4444" if item["direction"] == "increase" else "#10b981"
+            arrow = "↑" if item["direction"] == "increase" else "↓"
 
-        st.markdown(f"""
+            rank_text = ""
+            if item["contribution_rank"] is not None:
+                rank_text = (
+                    f'<div style="font-size:0.8rem; color:#6b7280; margin-top:2px;">'
+                    f'Larger share than in {item["contribution_rank"]:.0f}% of the reference population</div>'
+                )
+
+            st.markdown(f"""
         <div style="margin-top:12px;">
             <div style="display:flex; justify-content:space-between;">
                 <span><strong>{FEATURE_LABELS.get(item['feature'], item['feature'])}</strong> {arrow}</span>
@@ -1030,33 +1888,28 @@ if st.button("Assess metabolic pattern"):
             <div style="height:8px; background:#f3f4f6; border-radius:6px; margin-top:4px;">
                 <div style="width:{item['percent']}%; height:8px; background:{color}; border-radius:6px;"></div>
             </div>
+            {rank_text}
         </div>
         """, unsafe_allow_html=True)
 
-    # ==================================================
-    # POPULATION DEVIATION ANALYSIS
-    # ==================================================
+        # ==================================================
+        # POPULATION DEVIATION ANALYSIS
+        # ==================================================
 
-    st.markdown("""
+        st.markdown("""
     <div style="margin-top:2.5rem;">
     <strong style="font-size:1.1rem;">Population Deviation Analysis</strong>
     </div>
     """, unsafe_allow_html=True)
 
-    for item in explain_data:
+        if not EMPIRICAL_PERCENTILES:
+            st.caption(PERCENTILE_ESTIMATE_NOTE)
 
-        z = item["z_score"]
+        for item in explain_data:
 
-        if abs(z) < 0.5:
-            color = "#6b7280"
-        elif abs(z) < 1:
-            color = "#f59e0b"
-        elif abs(z) < 2:
-            color = "#ef4444"
-        else:
-            color = "#7c2d12"
+            color = DEVIATION_COLORS[item["deviation_severity"]]
 
-        st.markdown(f"""
+            st.markdown(f"""
 <div class="deviation-card">
     <div class="deviation-title" style="color:{color};">
         {item["deviation_text"]}
@@ -1067,11 +1920,46 @@ if st.button("Assess metabolic pattern"):
 </div>
 """, unsafe_allow_html=True)
 
-    # ==================================================
-    # SCALE + CATEGORY
-    # ==================================================
+        # ==================================================
+        # WHAT WOULD CHANGE THE CATEGORY
+        # ==================================================
+
+        st.markdown("""
+    <div style="margin-top:2.5rem;">
+    <strong style="font-size:1.1rem;">What Would Change the Category</strong>
+    </div>
+    """, unsafe_allow_html=True)
+
+        for row in counterfactuals:
+
+            lines = []
+            if row["lower"] is not None:
+                lines.append(
+                    f"below <strong>{format_counterfactual(row['feature'], row['lower'])}</strong> "
+                    f"→ {row['lower']['category']}"
+                )
+            if row["upper"] is not None:
+                lines.append(
+                    f"from <strong>{format_counterfactual(row['feature'], row['upper'])}</strong> "
+                    f"→ {row['upper']['category']}"
+                )
+
+            st.markdown(f"""
+<div class="deviation-card">
+    <div class="deviation-title">
+        {FEATURE_LABELS.get(row['feature'], row['feature'])}: currently {row['current']:.1f} {FEATURE_UNITS.get(row['feature'], '')}
+    </div>
+    <div style="font-size:0.9rem; color:#6b7280;">
+        {"<br>".join(lines)}
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+        # ==================================================
+        # SCALE + CATEGORY
+        # ==================================================
 
-    st.markdown(f"""
+        st.markdown(f"""
     <div class="scale-container">
         <div class="scale-bar">
             <div class="scale-marker" style="left: {percentile}%;"></div>
@@ -1084,23 +1972,23 @@ if st.button("Assess metabolic pattern"):
     </div>
     """, unsafe_allow_html=True)
 
-    st.markdown(f"""
+        st.markdown(f"""
     <div class="risk-category">
         <span class="risk-icon">{demo["icon"]}</span>
         {demo["category"]}
     </div>
     """, unsafe_allow_html=True)
 
-    st.markdown(
-        f'<p style="color: #4b5563; margin-bottom: 1.5rem; font-size: 1.1rem;">{demo["interpretation"]}</p>',
-        unsafe_allow_html=True
-    )
+        st.markdown(
+            f'<p style="color: #4b5563; margin-bottom: 1.5rem; font-size: 1.1rem;">{demo["interpretation"]}</p>',
+            unsafe_allow_html=True
+        )
 
+            # ==================================================
+        # WHAT DRIVES THIS RESULT
         # ==================================================
-    # WHAT DRIVES THIS RESULT
-    # ==================================================
 
-    st.markdown('''
+        st.markdown('''
     <div>
         <strong style="color: #1f2937; font-size: 1rem; display: block; margin-bottom: 1rem;">
             What drives this result:
@@ -1108,20 +1996,20 @@ if st.button("Assess metabolic pattern"):
         <ul class="driver-list">
     ''', unsafe_allow_html=True)
 
-    for driver in demo['drivers']:
-        st.markdown(f'<li>{driver}</li>', unsafe_allow_html=True)
+        for driver in demo['drivers']:
+            st.markdown(f'<li>{driver}</li>', unsafe_allow_html=True)
 
-    st.markdown('''
+        st.markdown('''
         </ul>
     </div>
     ''', unsafe_allow_html=True)
 
     
-    # ==================================================
-    # WHY THIS SIGNAL MATTERS
-    # ==================================================
+        # ==================================================
+        # WHY THIS SIGNAL MATTERS
+        # ==================================================
 
-    st.markdown('''
+        st.markdown('''
     <div style="margin-top: 1.5rem;">
         <strong style="color: #1f2937; font-size: 1rem; display: block; margin-bottom: 0.75rem;">
             Why this signal matters:
@@ -1129,47 +2017,480 @@ if st.button("Assess metabolic pattern"):
         <p style="color: #4b5563; margin: 0; line-height: 1.6;">
     ''', unsafe_allow_html=True)
 
-    st.markdown(f'{demo["why_this_matters"]}', unsafe_allow_html=False)
+        st.markdown(f'{demo["why_this_matters"]}', unsafe_allow_html=False)
 
-    st.markdown('''
+        st.markdown('''
         </p>
     </div>
     ''', unsafe_allow_html=True)
 
-    # ==================================================
-    # DOWNLOAD PDF BUTTON
-    # ==================================================
+        # ==================================================
+        # LONGITUDINAL TRAJECTORY
+        # ==================================================
+
+        if trajectory is not None:
 
-    inputs_for_pdf = {
-        "Fasting Glucose": f"{glucose} mg/dL",
-        "HbA1c": f"{hba1c} %",
-        "Triglycerides": f"{tg} mg/dL",
-        "Body Mass Index": f"{bmi}"
-    }
+            st.markdown("""
+        <div style="margin-top:2.5rem;">
+        <strong style="font-size:1.1rem;">Longitudinal Trajectory</strong>
+        </div>
+        """, unsafe_allow_html=True)
 
-    pdf_buffer = generate_pdf_report(
-        percentile,
-        demo,
-        explain_data,
-        inputs_for_pdf,
-        source_url="https://early-metabolic-risk.streamlit.app/"
-    )
+            if trajectory["n_visits"] == 1:
+                st.markdown(
+                    f'<p style="color:#6b7280;">First recorded visit for subject '
+                    f'<strong>{html.escape(subject_id)}</strong>. Changes will be shown from the next visit.</p>',
+                    unsafe_allow_html=True
+                )
+            else:
+                t1, t2, t3 = st.columns(3)
+                t1.metric("Visits", trajectory["n_visits"])
+                t2.metric(
+                    "Percentile vs previous visit",
+                    percentile,
+                    f"{trajectory['percentile_change']:+d}",
+                    delta_color="inverse"
+                )
+                t3.metric(
+                    "Change since first visit",
+                    f"{trajectory['total_change']:+d}"
+                )
+
+                transition = trajectory["category_transition"]
+                top_mover = trajectory["top_mover"]
+
+                if transition:
+                    transition_text = f"Category moved from <strong>{transition['from']}</strong> to <strong>{transition['to']}</strong>"
+                else:
+                    transition_text = "Category unchanged since the previous visit"
+
+                mover_text = ""
+                if top_mover:
+                    mover_direction = "towards higher risk" if top_mover["delta"] > 0 else "towards lower risk"
+                    mover_text = (
+                        f"Largest contribution shift: <strong>"
+                        f"{FEATURE_LABELS.get(top_mover['feature'], top_mover['feature'])}</strong> "
+                        f"({top_mover['delta']:+.2f}, {mover_direction})"
+                    )
+
+                st.markdown(f"""
+<div class="deviation-card">
+    <div class="deviation-title">{transition_text}</div>
+    <div style="font-size:0.9rem; color:#6b7280;">{mover_text}</div>
+</div>
+""", unsafe_allow_html=True)
 
-    st.download_button(
-        label="Download PDF Report",
-        data=pdf_buffer,
-        file_name="metabolic_risk_report.pdf",
-        mime="application/pdf"
-    )
+        METRICS.observe("render", time.perf_counter() - render_start)
+        profile.lap("render")
 
-    # ==================================================
-    # FOOTER
-    # ==================================================
+        # ==================================================
+        # DOWNLOAD PDF BUTTON
+        # ==================================================
+
+        inputs_for_pdf = {
+            "Fasting Glucose": f"{glucose} mg/dL",
+            "HbA1c": f"{hba1c} %",
+            "Triglycerides": f"{tg} mg/dL",
+            "Body Mass Index": f"{bmi}"
+        }
 
-    st.markdown('''
+        # Reports with a visit history are per subject and never cached; the
+        # date is part of the key because the report prints when it was generated
+        pdf_key = None
+        pdf_bytes = None
+        if trajectory is None and not WARMUP_RUN:
+            pdf_key = cache_key("pdf", assessment_key, datetime.now().strftime("%Y-%m-%d"))
+            pdf_bytes = disk_cache_get(pdf_key, "pdf", raw=True)
+
+        try:
+            if pdf_bytes is not None:
+                pdf_buffer = BytesIO(pdf_bytes)
+            else:
+                with LIMITERS["pdf"].slot(), METRICS.timer("pdf"):
+                    pdf_buffer = generate_pdf_report(
+                        percentile,
+                        demo,
+                        explain_data,
+                        inputs_for_pdf,
+                        source_url="https://early-metabolic-risk.streamlit.app/",
+                        trajectory=trajectory,
+                        uncertainty=uncertainty,
+                        counterfactuals=counterfactuals,
+                        calibration=calibration,
+                        percentile_band=percentile_band,
+                        reference_group=reference_group
+                    )
+                if pdf_key is not None:
+                    RESULT_CACHE.put_bytes(pdf_key, "pdf", pdf_buffer.getvalue())
+        except ServerBusy:
+            pdf_buffer = None
+        profile.lap("pdf")
+
+        if pdf_buffer is not None:
+            st.download_button(
+                label="Download PDF Report",
+                data=pdf_buffer,
+                file_name="metabolic_risk_report.pdf",
+                mime="application/pdf"
+            )
+        else:
+            st.info("The PDF report is temporarily unavailable because the server is busy. Please assess again shortly.")
+
+        # ==================================================
+        # FOOTER
+        # ==================================================
+
+        st.markdown('''
     <div class="footer glass">
         Percentiles are computed relative to a fixed reference population used during model validation. 
         This output reflects population-level statistical patterns and is intended for research and 
         exploratory purposes only. It does not represent an individual diagnosis or prediction.
     </div>
     ''', unsafe_allow_html=True)
+
+# ======================================================
+# WHAT-IF RISK SURFACE
+# ======================================================
+
+@st.cache_data(max_entries=256)
+def cached_risk_surface(model_version, x_feature, y_feature, fixed_values):
+    # model_version is part of the cache key; the model itself is the loaded global
+    METRICS.inc("emra_cache_misses_total", cache="risk_surface")
+    values = dict(fixed_values)
+    return risk_surface(
+        model,
+        REFERENCE_SCORES,
+        [values.get(name, np.nan) for name in feature_names],
+        feature_names.index(x_feature),
+        feature_names.index(y_feature),
+        INPUT_RANGES[x_feature],
+        INPUT_RANGES[y_feature]
+    )
+
+with st.expander("What-if risk surface"):
+
+    current_values = {"LBXGLU": glucose, "LBXGH": hba1c, "LBXTR": tg, "BMXBMI": bmi}
+
+    sx, sy = st.columns(2)
+    x_feature = sx.selectbox(
+        "Horizontal axis", feature_names, index=0,
+        format_func=lambda name: FEATURE_LABELS.get(name, name)
+    )
+    y_feature = sy.selectbox(
+        "Vertical axis", [name for name in feature_names if name != x_feature], index=1,
+        format_func=lambda name: FEATURE_LABELS.get(name, name)
+    )
+
+    fixed_values = tuple(
+        (name, float(current_values[name]))
+        for name in feature_names if name not in (x_feature, y_feature)
+    )
+
+    METRICS.inc("emra_cache_requests_total", cache="risk_surface")
+    surface = cached_risk_surface(MODEL_VERSION, x_feature, y_feature, fixed_values)
+
+    st.caption(
+        "Held at your values: " + ", ".join(
+            f"{FEATURE_LABELS.get(name, name)} {value} {FEATURE_UNITS.get(name, '')}".strip()
+            for name, value in fixed_values
+        )
+    )
+
+    x_label = f"{FEATURE_LABELS[x_feature]} ({FEATURE_UNITS[x_feature]})"
+    y_label = f"{FEATURE_LABELS[y_feature]} ({FEATURE_UNITS[y_feature]})"
+
+    gx, gy = np.meshgrid(surface["x"], surface["y"])
+    x_step = surface["x"][1] - surface["x"][0]
+    y_step = surface["y"][1] - surface["y"][0]
+
+    heatmap_df = pd.DataFrame({
+        "x": gx.ravel() - x_step / 2,
+        "x2": gx.ravel() + x_step / 2,
+        "y": gy.ravel() - y_step / 2,
+        "y2": gy.ravel() + y_step / 2,
+        "percentile": surface["percentiles"].ravel()
+    })
+
+    boundary_df = pd.DataFrame([
+        {"x": x, "y": y, "boundary": f"{bound}th percentile"}
+        for bound, (xs, ys) in surface["boundaries"].items()
+        for x, y in zip(xs, ys)
+    ], columns=["x", "y", "boundary"])
+
+    heatmap = alt.Chart(heatmap_df).mark_rect().encode(
+        x=alt.X("x:Q", title=x_label, scale=alt.Scale(domain=list(INPUT_RANGES[x_feature]), nice=False)),
+        x2="x2:Q",
+        y=alt.Y("y:Q", title=y_label, scale=alt.Scale(domain=list(INPUT_RANGES[y_feature]), nice=False)),
+        y2="y2:Q",
+        color=alt.Color(
+            "percentile:Q",
+            scale=alt.Scale(domain=[20, 30, 60, 90], range=["#10b981", "#10b981", "#f59e0b", "#ef4444"]),
+            title="Percentile"
+        )
+    )
+
+    contours = alt.Chart(boundary_df).mark_line(color="white", strokeWidth=2).encode(
+        x="x:Q",
+        y="y:Q",
+        detail="boundary:N",
+        tooltip=["boundary:N"]
+    )
+
+    marker = alt.Chart(pd.DataFrame([{
+        "x": current_values[x_feature],
+        "y": current_values[y_feature]
+    }])).mark_point(color="#1f2937", size=120, filled=True).encode(x="x:Q", y="y:Q")
+
+    st.altair_chart((heatmap + contours + marker).properties(width="container", height=420))
+
+# ======================================================
+# BATCH ASSESSMENT
+# ======================================================
+
+def batch_strata(raw):
+    # Age and sex columns, by bundle code (RIDAGEYR / RIAGENDR) or plain name;
+    # sex may be given as a code or a label. Rows missing either use the global reference
+    info = metadata.get("reference_strata", {})
+    columns = {str(c).strip().lower(): c for c in raw.columns}
+    age_column = next((columns[n] for n in (info.get("age_column", "").lower(), "age") if n in columns), None)
+    sex_column = next((columns[n] for n in (info.get("sex_column", "").lower(), "sex") if n in columns), None)
+    if age_column is None or sex_column is None:
+        return None
+
+    codes = dict(zip(STRATIFIED_REFERENCE["sex_labels"], STRATIFIED_REFERENCE["sex_codes"]))
+    sexes = raw[sex_column].map(lambda v: codes.get(str(v).strip().lower(), v))
+    return resolve_strata(
+        STRATIFIED_REFERENCE,
+        pd.to_numeric(raw[age_column], errors="coerce").to_numpy(dtype=float),
+        pd.to_numeric(sexes, errors="coerce").to_numpy(dtype=float)
+    )
+
+def batch_uncertainty(X, segments):
+    # Measurement uncertainty per subject, against the same reference
+    # (global or stratum) as the batch percentile; one pass per segment
+    columns = ["percentile_low", "percentile_high"] + [
+        f"category_prob_{code}" for code in range(len(CATEGORY_LABELS))
+    ]
+    out = pd.DataFrame(index=X.index, columns=columns, dtype=float)
+    if segments is None:
+        segments = np.full(len(X), GLOBAL_STRATUM)
+
+    for segment in np.unique(segments):
+        rows = np.flatnonzero(segments == segment)
+        reference_scores = REFERENCE_SCORES if segment == GLOBAL_STRATUM else stratum_scores(STRATIFIED_REFERENCE, segment)
+        mc = measurement_uncertainty(model, X.to_numpy()[rows], feature_names, reference_scores)
+        out.iloc[rows, 0] = mc["low"]
+        out.iloc[rows, 1] = mc["high"]
+        out.iloc[rows, 2:] = np.round(mc["category_probs"], 3)
+
+    return out.astype({"percentile_low": int, "percentile_high": int})
+
+@st.cache_data(max_entries=16)
+def run_batch(model_version, csv_bytes, units, with_uncertainty=False):
+
+    METRICS.inc("emra_cache_misses_total", cache="batch")
+    raw = pd.read_csv(BytesIO(csv_bytes))
+    normalized = normalize_inputs(raw, feature_names, dict(units))
+
+    accepted = normalized["accepted"]
+    X = normalized["X"][accepted]
+
+    segments = None
+    if STRATIFIED_REFERENCE is not None:
+        segments = batch_strata(raw[np.asarray(accepted)])
+
+    with LIMITERS["batch"].slot(), METRICS.timer("batch"):
+        scored = score_batch(model, X.to_numpy(), REFERENCE_SCORES, strata=STRATIFIED_REFERENCE, segments=segments)
+
+    drift_monitor.update(X.to_numpy(), scored["score"])
+
+    # Source row number and the file's own ID column (if any) let every exported
+    # row and cohort PDF page be matched back to the uploaded file
+    identity = pd.DataFrame({SOURCE_ROW: np.flatnonzero(np.asarray(accepted)) + 1}, index=X.index)
+    id_column = find_id_column(raw)
+    if id_column is not None and id_column not in feature_names:
+        identity[id_column] = raw.loc[X.index, id_column]
+
+    results = pd.concat([identity, X], axis=1)
+    results["score"] = scored["score"]
+    results["percentile"] = scored["percentile"]
+    results["category_code"] = scored["category_code"]
+    results["category"] = [CATEGORY_LABELS[code] for code in scored["category_code"]]
+    if segments is not None:
+        results["reference_group"] = [STRATIFIED_REFERENCE["labels"][segment] for segment in segments]
+    for j, name in enumerate(feature_names):
+        results[f"share_{name}"] = np.round(scored["shares"][:, j], 1)
+
+    # Same reference-population rank of each share as the single-subject view
+    ranks = contribution_percentiles(scored["shares"], CONTRIBUTION_QUANTILES)
+    if ranks is not None:
+        for j, name in enumerate(feature_names):
+            results[f"rank_{name}"] = np.round(ranks[:, j], 1)
+
+    # Opt-in: ~1 s per 1,000 subjects at the default 2,000 samples
+    if with_uncertainty:
+        with LIMITERS["batch"].slot(), METRICS.timer("batch_uncertainty"):
+            results = pd.concat([results, batch_uncertainty(X, segments)], axis=1)
+
+    return results, normalized["counts"], int((~accepted).sum())
+
+def batch_job(func, *args):
+    METRICS.inc("emra_requests_total", kind="export")
+    with LIMITERS["batch"].slot(), METRICS.timer("export"), profiled("export", PROFILING, keep=PROFILE_KEEP_N):
+        return func(*args)
+
+with st.expander("Batch assessment (CSV)"):
+
+    st.caption(
+        "One row per subject. Columns may use model codes or common names "
+        "(glucose, hba1c, triglycerides, bmi, height, weight); a per-row "
+        "unit can be given in a <column>_unit column."
+    )
+
+    batch_file = st.file_uploader("Upload biomarker CSV", type=["csv"])
+
+    unit_columns = st.columns(len(feature_names))
+    batch_units = tuple(
+        (name, unit_columns[j].selectbox(
+            f"{FEATURE_LABELS.get(name, name)} unit",
+            list(NORMALIZATION_SCHEMA[name]["units"]),
+            key=f"batch_unit_{name}"
+        ))
+        for j, name in enumerate(feature_names)
+    )
+
+    batch_with_uncertainty = st.checkbox(
+        "Include measurement uncertainty",
+        key="batch_uncertainty",
+        help="Adds a 5–95% percentile interval and per-category probabilities "
+             "(category_prob_<code>) for every subject. Slower on large files."
+    )
+
+    if batch_file is not None:
+        # Streamlit reruns this block on every widget change; count a batch
+        # request only when the upload (or its scoring options) changes.
+        # Unit and uncertainty choices are part of the key because they
+        # also start a new run_batch computation
+        batch_request = (
+            hashlib.sha256(batch_file.getvalue()).hexdigest(), batch_units, batch_with_uncertainty
+        )
+        if st.session_state.get("batch_request") != batch_request:
+            st.session_state.batch_request = batch_request
+            METRICS.inc("emra_requests_total", kind="batch")
+            METRICS.inc("emra_cache_requests_total", cache="batch")
+        try:
+            with profiled("batch", PROFILING, keep=PROFILE_KEEP_N):
+                batch_results, batch_counts, batch_rejected = run_batch(
+                    MODEL_VERSION, batch_file.getvalue(), batch_units, batch_with_uncertainty
+                )
+        except ServerBusy:
+            st.warning("Batch scoring is busy with other jobs. Please try again in a moment.")
+            st.stop()
+
+        st.write(f"Scored {len(batch_results)} subjects, rejected {batch_rejected} rows without usable values.")
+
+        if batch_counts:
+            st.dataframe(pd.DataFrame(
+                [{"rule": rule, "rows": count} for rule, count in batch_counts.items()]
+            ), hide_index=True)
+
+        st.dataframe(batch_results)
+
+        interpretations = {
+            code: percentile_to_demo_output(int(bound))
+            for code, bound in enumerate((0, *CATEGORY_BOUNDS))
+        }
+
+        # Deferred: the export is only written (in chunks, on disk) when clicked
+        d1, d2, d3 = st.columns(3)
+        d1.download_button(
+            "Download results (CSV)",
+            data=lambda: batch_job(export_file, batch_results, "csv"),
+            file_name="metabolic_risk_batch.csv",
+            mime="text/csv"
+        )
+        d2.download_button(
+            "Download results (Excel)",
+            data=lambda: batch_job(export_file, batch_results, "xlsx", interpretations),
+            file_name="metabolic_risk_batch.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+        d3.download_button(
+            "Download cohort report (PDF)",
+            data=lambda: batch_job(
+                cohort_report_file,
+                batch_results,
+                "https://early-metabolic-risk.streamlit.app/",
+                interpretations,
+                find_id_column(batch_results) or SOURCE_ROW
+            ),
+            file_name="metabolic_risk_cohort.pdf",
+            mime="application/pdf"
+        )
+
+# ======================================================
+# DRIFT MONITOR PANEL
+# ======================================================
+
+drift_report = drift_monitor.report()
+
+with st.sidebar.expander("Input drift monitor"):
+    thresholds = drift_report["thresholds"]
+    if drift_report["feature_reference"] == "training distribution":
+        feature_rule = "biomarker PSI/KS vs training distribution"
+    else:
+        feature_rule = (
+            f"biomarker mean shift > {thresholds['z_mean']} SD or spread outside "
+            f"1/{thresholds['z_std_ratio']}–{thresholds['z_std_ratio']}x training SD"
+        )
+    st.caption(
+        f"{drift_report['n_scores']} scored inputs since start · alerts from "
+        f"PSI > {thresholds['psi']} or KS > {thresholds['ks']} (score and "
+        f"{feature_rule})"
+    )
+
+    if drift_report["score"] is None:
+        st.write("No inputs scored yet.")
+    else:
+        if not drift_report["ready"]:
+            st.write("Collecting data — alerts start after enough inputs.")
+        for alert in drift_report["alerts"]:
+            st.warning(alert)
+
+        st.dataframe(pd.DataFrame(
+            [{"signal": "risk score", **drift_report["score"]}] +
+            [{"signal": FEATURE_LABELS.get(name, name), **stats}
+             for name, stats in drift_report["features"].items()]
+        ), hide_index=True)
+
+# ======================================================
+# SERVER LOAD PANEL
+# ======================================================
+
+with st.sidebar.expander("Server load"):
+    st.dataframe(
+        pd.DataFrame([limiter.stats() for limiter in LIMITERS.values()]),
+        hide_index=True
+    )
+
+# ======================================================
+# PROFILE CAPTURES (admin only)
+# ======================================================
+
+def read_profile(path):
+    # The capture may have been rotated out since this list was drawn
+    return path.read_bytes() if path.exists() else b""
+
+if PROFILING:
+    with st.sidebar.expander("Profile captures"):
+        captures = list_profiles()[:PROFILE_KEEP_N]
+        if not captures:
+            st.write("No captures yet. Run an assessment or batch job.")
+        for i, path in enumerate(captures):
+            st.download_button(
+                path.stem,
+                data=lambda path=path: read_profile(path),
+                file_name=path.name,
+                mime="application/zip",
+                key=f"profile_{i}"
+            )
@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import json
+from datetime import date
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from scoring import (
+    FEATURE_QUANTILES_PATH,
+    CONTRIBUTION_QUANTILES_PATH,
+    CALIBRATION_PATH,
+    REFERENCE_BANDS_PATH,
+    STRATA_PATH,
+    MIN_STRATUM_SIZE,
+    SEX_CODES,
+    build_feature_quantiles,
+    contribution_shares,
+    fit_calibration_table,
+    calibrated_probabilities,
+    bootstrap_reference_bands,
+    build_stratified_reference,
+    age_band_label
+)
+
+# ======================================================
+# MODEL BUNDLE PRECOMPUTATION
+# ======================================================
+# Offline companion to 03_model_training.ipynb: derives the lookup tables
+# shipped next to emra_pipeline.joblib so the app never computes them
+# per request.
+
+MODELS_DIR = Path("models")
+MODEL_PATH = MODELS_DIR / "emra_pipeline.joblib"
+META_PATH = MODELS_DIR / "emra_metadata.json"
+REFERENCE_PATH = MODELS_DIR / "reference_scores.npy"
+
+
+def update_metadata(**entries):
+    with open(META_PATH, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    metadata.update(entries)
+    with open(META_PATH, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+        f.write("\n")
+    return metadata
+
+
+def build_quantiles(population_csv, feature_names):
+    population = pd.read_csv(population_csv)
+    table = build_feature_quantiles(population[feature_names].to_numpy(), feature_names)
+    np.savez_compressed(FEATURE_QUANTILES_PATH, **table)
+    update_metadata(feature_quantiles={
+        "file": FEATURE_QUANTILES_PATH.name,
+        "source": Path(population_csv).name,
+        "n": int(len(population)),
+        "n_quantiles": int(len(table["probs"]))
+    })
+    print(f"Wrote {FEATURE_QUANTILES_PATH} from {len(population)} rows")
+
+
+def build_contribution_quantiles(reference_csv, feature_names):
+
+    model = joblib.load(MODEL_PATH)
+    reference = pd.read_csv(reference_csv)
+    X = reference[feature_names].to_numpy(dtype=float)
+
+    # The CSV must be the population behind reference_scores.npy
+    scores = np.sort(model.predict_proba(reference[feature_names])[:, 1])
+    reference_scores = np.load(REFERENCE_PATH)
+    if len(scores) != len(reference_scores) or not np.allclose(scores, reference_scores):
+        print("Warning: reference CSV does not reproduce reference_scores.npy")
+
+    _, shares = contribution_shares(model, X)
+    table = build_feature_quantiles(shares, feature_names)
+    np.savez_compressed(CONTRIBUTION_QUANTILES_PATH, **table)
+    update_metadata(contribution_quantiles={
+        "file": CONTRIBUTION_QUANTILES_PATH.name,
+        "source": Path(reference_csv).name,
+        "n": int(len(reference)),
+        "n_quantiles": int(len(table["probs"]))
+    })
+    print(f"Wrote {CONTRIBUTION_QUANTILES_PATH} from {len(reference)} rows")
+
+
+def build_calibration(labelled_csv, feature_names, label_column, method):
+
+    model = joblib.load(MODEL_PATH)
+    labelled = pd.read_csv(labelled_csv)
+    scores = model.predict_proba(labelled[feature_names])[:, 1]
+    labels = labelled[label_column].to_numpy()
+
+    table = fit_calibration_table(scores, labels, method)
+    np.savez_compressed(CALIBRATION_PATH, **table)
+
+    digest = hashlib.sha256(table["values"].tobytes()).hexdigest()[:8]
+    calibrated = calibrated_probabilities(scores, table)
+
+    update_metadata(recalibration={
+        "file": CALIBRATION_PATH.name,
+        "method": method,
+        "version": f"{date.today():%Y%m%d}-{digest}",
+        "source": Path(labelled_csv).name,
+        "n": int(len(labelled)),
+        "brier_raw": round(float(np.mean((scores - labels) ** 2)), 4),
+        "brier_calibrated": round(float(np.mean((calibrated - labels) ** 2)), 4)
+    })
+    print(f"Wrote {CALIBRATION_PATH} ({method}, {len(table['breakpoints'])} breakpoints)")
+
+
+def build_reference_bands(n_bootstrap, seed):
+
+    reference_scores = np.load(REFERENCE_PATH)
+    bands = bootstrap_reference_bands(reference_scores, n_bootstrap=n_bootstrap, seed=seed)
+    np.savez_compressed(REFERENCE_BANDS_PATH, **bands)
+
+    update_metadata(reference_bands={
+        "file": REFERENCE_BANDS_PATH.name,
+        "reference_sha256": hashlib.sha256(REFERENCE_PATH.read_bytes()).hexdigest()[:12],
+        "n_bootstrap": n_bootstrap,
+        "level": int(bands["level"]),
+        "seed": seed
+    })
+    print(f"Wrote {REFERENCE_BANDS_PATH} ({n_bootstrap} resamples of {len(reference_scores)} scores)")
+
+
+def build_strata(strata_csv, feature_names, age_column, sex_column, age_edges, min_size):
+
+    model = joblib.load(MODEL_PATH)
+    population = pd.read_csv(strata_csv)
+    scores = model.predict_proba(population[feature_names])[:, 1]
+
+    packed, index = build_stratified_reference(
+        np.load(REFERENCE_PATH),
+        scores,
+        pd.to_numeric(population[age_column], errors="coerce").to_numpy(dtype=float),
+        pd.to_numeric(population[sex_column], errors="coerce").to_numpy(dtype=float),
+        age_edges,
+        min_size=min_size
+    )
+    np.save(STRATA_PATH, packed)
+
+    sizes = np.diff(index["offsets"])
+    update_metadata(reference_strata={
+        "file": STRATA_PATH.name,
+        "source": Path(strata_csv).name,
+        "reference_sha256": hashlib.sha256(REFERENCE_PATH.read_bytes()).hexdigest()[:12],
+        "age_column": age_column,
+        "sex_column": sex_column,
+        "age_edges": [float(edge) for edge in age_edges],
+        "sex_codes": list(SEX_CODES),
+        "sex_labels": list(SEX_CODES.values()),
+        "min_size": min_size,
+        "offsets": index["offsets"].tolist(),
+        "slots": index["slots"].tolist()
+    })
+
+    print(f"Wrote {STRATA_PATH} ({len(sizes) - 1} strata plus the global reference)")
+    for band, row in enumerate(index["slots"]):
+        for label, segment in zip(SEX_CODES.values(), row):
+            n = f"{sizes[segment]} scores" if segment else "global fallback"
+            print(f"  {label}, age {age_band_label(age_edges, band)}: {n}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Precompute EMRA model bundle tables.")
+    parser.add_argument(
+        "--population",
+        help="CSV of the training population with one column per model feature"
+    )
+    parser.add_argument(
+        "--reference",
+        help="CSV of the hold-out reference population behind reference_scores.npy"
+    )
+    parser.add_argument(
+        "--calibration",
+        help="Labelled CSV (model features plus a label column) for recalibration"
+    )
+    parser.add_argument("--label-column", default="label")
+    parser.add_argument("--calibration-method", choices=["isotonic", "platt"], default="isotonic")
+    parser.add_argument(
+        "--bootstrap",
+        action="store_true",
+        help="Bootstrap reference_scores.npy into percentile confidence bands"
+    )
+    parser.add_argument("--n-bootstrap", type=int, default=2000)
+    parser.add_argument(
+        "--strata",
+        help="CSV of a scored reference population with age and sex columns, split into age/sex strata"
+    )
+    parser.add_argument("--age-column", default="RIDAGEYR")
+    parser.add_argument("--sex-column", default="RIAGENDR")
+    parser.add_argument("--age-edges", default="40,60", help="Comma-separated age band boundaries")
+    parser.add_argument("--min-stratum", type=int, default=MIN_STRATUM_SIZE,
+                        help="Smaller strata fall back to the global reference")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(META_PATH, "r", encoding="utf-8") as f:
+        feature_names = json.load(f)["features"]
+
+    if args.population:
+        build_quantiles(args.population, feature_names)
+
+    if args.reference:
+        build_contribution_quantiles(args.reference, feature_names)
+
+    if args.calibration:
+        build_calibration(args.calibration, feature_names, args.label_column, args.calibration_method)
+
+    if args.bootstrap:
+        build_reference_bands(args.n_bootstrap, args.seed)
+
+    if args.strata:
+        build_strata(
+            args.strata, feature_names, args.age_column, args.sex_column,
+            [float(edge) for edge in args.age_edges.split(",")], args.min_stratum
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import math
+import threading
+
+import numpy as np
+
+# ======================================================
+# STREAMING DRIFT MONITOR
+# ======================================================
+# Constant-memory histograms of live scores and inputs.
+# Score bins are reference-quantile bins, so the expected share per bin
+# comes straight from reference_scores.npy. Feature bins are decile bins
+# of the training population when feature_quantiles.npz is available;
+# PSI/KS then compare against the real training distribution.
+# Without that table only the scaler's mean and std are known, and the
+# biomarkers are skewed (TG is close to lognormal), so a z-score histogram
+# would never match N(0, 1). In that case PSI/KS are still shown, but
+# alerts come only from the shift of the live z-score mean and std.
+
+PSI_THRESHOLD = 0.2
+KS_THRESHOLD = 0.1
+Z_MEAN_THRESHOLD = 0.5
+Z_STD_RATIO = 1.5
+MIN_COUNT = 100
+
+DEFAULT_Z_EDGES = np.arange(-3.0, 3.01, 0.5)
+FEATURE_BIN_PROBS = np.linspace(0, 1, 11)[1:-1]
+
+_EPS = 1e-4
+
+
+def _normal_cdf(x):
+    return np.array([0.5 * (1.0 + math.erf(v / math.sqrt(2.0))) for v in x])
+
+
+def _psi(observed, expected):
+    p = np.maximum(observed, _EPS)
+    q = np.maximum(expected, _EPS)
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+def _ks(observed, expected):
+    return float(np.max(np.abs(np.cumsum(observed) - np.cumsum(expected))))
+
+
+def _quantile_bins(table, probs=FEATURE_BIN_PROBS):
+    # Per-feature decile edges in raw units, padded with +inf so every
+    # feature has the same bin count; padded bins expect and see nothing.
+    # P(x < edge) is read from the table's grid, so point masses (ties in
+    # the training data) land in the bin that starts at them.
+    grid = np.asarray(table["probs"], dtype=float)
+    edges = np.full((len(table["quantiles"]), len(probs)), np.inf)
+    expected = np.zeros((len(table["quantiles"]), len(probs) + 1))
+
+    for j, q in enumerate(np.asarray(table["quantiles"], dtype=float)):
+        e = np.unique(np.interp(probs, grid, q))
+        below = grid[np.minimum(np.searchsorted(q, e, side="left"), len(grid) - 1)]
+        edges[j, :len(e)] = e
+        expected[j, :len(e) + 1] = np.diff(np.concatenate([[0.0], below, [1.0]]))
+
+    return edges, expected
+
+
+class DriftMonitor:
+
+    def __init__(
+        self,
+        reference_scores,
+        feature_names,
+        mean,
+        scale,
+        n_score_bins=20,
+        feature_quantiles=None,
+        z_edges=DEFAULT_Z_EDGES,
+        psi_threshold=PSI_THRESHOLD,
+        ks_threshold=KS_THRESHOLD,
+        z_mean_threshold=Z_MEAN_THRESHOLD,
+        z_std_ratio=Z_STD_RATIO,
+        min_count=MIN_COUNT
+    ):
+        reference_scores = np.asarray(reference_scores, dtype=float)
+
+        quantiles = np.linspace(0, 1, n_score_bins + 1)[1:-1]
+        self.score_edges = np.unique(np.quantile(reference_scores, quantiles))
+        self.score_expected = np.bincount(
+            np.searchsorted(self.score_edges, reference_scores, side="right"),
+            minlength=len(self.score_edges) + 1
+        ) / len(reference_scores)
+
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+
+        if feature_quantiles is not None:
+            self.feature_reference = "training distribution"
+            self.feature_edges, self.feature_expected = _quantile_bins(feature_quantiles)
+        else:
+            self.feature_reference = "training scaler"
+            z_edges = np.asarray(z_edges, dtype=float)
+            self.feature_edges = self.mean[:, None] + self.scale[:, None] * z_edges
+            self.feature_expected = np.tile(
+                np.diff(np.concatenate([[0.0], _normal_cdf(z_edges), [1.0]])),
+                (len(self.feature_names), 1)
+            )
+
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self.z_mean_threshold = z_mean_threshold
+        self.z_std_ratio = z_std_ratio
+        self.min_count = min_count
+
+        n_features = len(self.feature_names)
+        self._n_bins = self.feature_edges.shape[1] + 1
+        self._lock = threading.Lock()
+
+        self.n_scores = 0
+        self.score_counts = np.zeros(len(self.score_edges) + 1, dtype=np.int64)
+        self.feature_counts = np.zeros((n_features, self._n_bins), dtype=np.int64)
+        self.feature_missing = np.zeros(n_features, dtype=np.int64)
+        self.z_sum = np.zeros(n_features)
+        self.z_sumsq = np.zeros(n_features)
+
+    # ==================================================
+    # HOT PATH
+    # ==================================================
+
+    def update(self, X, scores):
+
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        scores = np.atleast_1d(np.asarray(scores, dtype=float))
+
+        score_counts = np.bincount(
+            np.searchsorted(self.score_edges, scores, side="right"),
+            minlength=len(self.score_counts)
+        )
+
+        z = (X - self.mean) / self.scale
+        missing = np.isnan(z)
+        z_filled = np.where(missing, 0.0, z)
+
+        # Same as searchsorted(side="right") per feature, for ragged edges
+        bins = (self.feature_edges[None, :, :] <= X[:, :, None]).sum(axis=2)
+        flat = np.arange(z.shape[1]) * self._n_bins + bins
+        feature_counts = np.bincount(
+            flat[~missing], minlength=self.feature_counts.size
+        ).reshape(self.feature_counts.shape)
+
+        with self._lock:
+            self.n_scores += len(scores)
+            self.score_counts += score_counts
+            self.feature_counts += feature_counts
+            self.feature_missing += missing.sum(axis=0)
+            self.z_sum += z_filled.sum(axis=0)
+            self.z_sumsq += (z_filled ** 2).sum(axis=0)
+
+    # ==================================================
+    # REPORT
+    # ==================================================
+
+    def report(self):
+
+        with self._lock:
+            n_scores = self.n_scores
+            score_counts = self.score_counts.copy()
+            feature_counts = self.feature_counts.copy()
+            feature_missing = self.feature_missing.copy()
+            z_sum = self.z_sum.copy()
+            z_sumsq = self.z_sumsq.copy()
+
+        result = {
+            "n_scores": n_scores,
+            "ready": n_scores >= self.min_count,
+            "thresholds": {
+                "psi": self.psi_threshold,
+                "ks": self.ks_threshold,
+                "z_mean": self.z_mean_threshold,
+                "z_std_ratio": self.z_std_ratio
+            },
+            "feature_reference": self.feature_reference,
+            "score": None,
+            "features": {},
+            "alerts": []
+        }
+
+        if n_scores == 0:
+            return result
+
+        observed = score_counts / n_scores
+        score_psi = _psi(observed, self.score_expected)
+        score_ks = _ks(observed, self.score_expected)
+        result["score"] = {"psi": round(score_psi, 4), "ks": round(score_ks, 4)}
+
+        if result["ready"]:
+            if score_psi > self.psi_threshold:
+                result["alerts"].append(f"Score PSI {score_psi:.3f} vs reference")
+            if score_ks > self.ks_threshold:
+                result["alerts"].append(f"Score KS {score_ks:.3f} vs reference")
+
+        for i, name in enumerate(self.feature_names):
+
+            n = feature_counts[i].sum()
+            if n == 0:
+                continue
+
+            observed = feature_counts[i] / n
+            psi = _psi(observed, self.feature_expected[i])
+            ks = _ks(observed, self.feature_expected[i])
+            z_mean = z_sum[i] / n
+            z_std = math.sqrt(max(z_sumsq[i] / n - z_mean ** 2, 0.0))
+
+            result["features"][name] = {
+                "psi": round(psi, 4),
+                "ks": round(ks, 4),
+                "z_mean": round(z_mean, 3),
+                "z_std": round(z_std, 3),
+                "missing": int(feature_missing[i])
+            }
+
+            if not result["ready"]:
+                continue
+
+            if self.feature_reference == "training distribution":
+                if psi > self.psi_threshold:
+                    result["alerts"].append(f"{name} PSI {psi:.3f} vs training distribution")
+                if ks > self.ks_threshold:
+                    result["alerts"].append(f"{name} KS {ks:.3f} vs training distribution")
+            else:
+                if abs(z_mean) > self.z_mean_threshold:
+                    result["alerts"].append(f"{name} mean shifted {z_mean:+.2f} SD vs training scaler")
+                if not 1 / self.z_std_ratio <= z_std <= self.z_std_ratio:
+                    result["alerts"].append(f"{name} spread {z_std:.2f}x training SD")
+
+        return result
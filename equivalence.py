@@ -0,0 +1,573 @@
+import argparse
+import ast
+import itertools
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from normalize import NORMALIZATION_SCHEMA
+from scoring import (
+    CATEGORY_BOUNDS,
+    scores_to_percentiles,
+    percentiles_to_category_codes,
+    predict_scores,
+    band_threshold_scores,
+    category_counterfactuals,
+    risk_surface,
+    contribution_shares,
+    score_batch,
+    STRATA_PATH,
+    build_stratified_reference,
+    load_stratified_reference,
+    stratified_percentiles,
+    stratum_scores
+)
+
+# ======================================================
+# DIFFERENTIAL EQUIVALENCE HARNESS
+# ======================================================
+# Every fast path is checked against the chain the app itself runs for a
+# single assessment: model.predict_proba -> score_to_percentile ->
+# percentile_to_demo_output. Those two functions (and INPUT_RANGES) are
+# taken from app.py's source, so the harness never drifts from the app.
+
+MODELS_DIR = Path("models")
+APP_PATH = Path(__file__).with_name("app.py")
+
+APP_FUNCTIONS = ("score_to_percentile", "percentile_to_demo_output")
+
+
+def load_app_reference(reference_scores, app_path=APP_PATH):
+    tree = ast.parse(Path(app_path).read_text(encoding="utf-8"))
+    # STRATIFIED_REFERENCE=None keeps score_to_percentile on its global path
+    namespace = {"np": np, "REFERENCE_SCORES": reference_scores, "STRATIFIED_REFERENCE": None}
+    input_ranges = None
+
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in APP_FUNCTIONS:
+            exec(compile(ast.Module(body=[node], type_ignores=[]), str(app_path), "exec"), namespace)
+        elif (
+            isinstance(node, ast.Assign)
+            and any(isinstance(t, ast.Name) and t.id == "INPUT_RANGES" for t in node.targets)
+        ):
+            input_ranges = ast.literal_eval(node.value)
+
+    return namespace["score_to_percentile"], namespace["percentile_to_demo_output"], input_ranges
+
+
+class ReferencePath:
+
+    def __init__(self, model, reference_scores, feature_names, app_path=APP_PATH):
+        self.model = model
+        self.feature_names = feature_names
+        self.score_to_percentile, self.percentile_to_demo_output, self.input_ranges = (
+            load_app_reference(reference_scores, app_path)
+        )
+        # Same label order as app.CATEGORY_LABELS
+        self.labels = [
+            self.percentile_to_demo_output(int(bound))["category"]
+            for bound in (0, *CATEGORY_BOUNDS)
+        ]
+
+    def scores(self, X):
+        return self.model.predict_proba(pd.DataFrame(X, columns=self.feature_names))[:, 1]
+
+    def percentiles(self, scores):
+        return np.array([self.score_to_percentile(score) for score in scores], dtype=int)
+
+    def categories(self, percentiles):
+        # One call per distinct percentile; the mapping is a pure function of it
+        distinct, inverse = np.unique(percentiles, return_inverse=True)
+        codes = np.array([
+            self.labels.index(self.percentile_to_demo_output(int(p))["category"])
+            for p in distinct
+        ], dtype=int)
+        return codes[inverse]
+
+    def shares(self, X):
+        # The explainability block of the app's button handler
+        frame = pd.DataFrame(X, columns=self.feature_names)
+        scaled = self.model.named_steps["scaler"].transform(self.model.named_steps["imputer"].transform(frame))
+        magnitude = np.abs(self.model.named_steps["model"].coef_[0] * scaled)
+        total = magnitude.sum(axis=1, keepdims=True)
+        return np.divide(magnitude * 100, total, out=np.zeros_like(magnitude), where=total != 0)
+
+
+# ======================================================
+# INPUT SETS
+# ======================================================
+
+def grid_inputs(ranges, feature_names, n_grid):
+    axes = [np.linspace(*ranges[name], n_grid) for name in feature_names]
+    return np.array(list(itertools.product(*axes)))
+
+
+def random_inputs(ranges, feature_names, n, rng, widen=0.5):
+    # Uniform over the input ranges widened on both sides, floored at zero
+    low = np.array([ranges[name][0] for name in feature_names])
+    high = np.array([ranges[name][1] for name in feature_names])
+    span = high - low
+    return rng.uniform(np.maximum(low - widen * span, 0.0), high + widen * span, (n, len(feature_names)))
+
+
+def nan_inputs(base):
+    # Every non-empty subset of missing biomarkers, as the imputer sees them
+    rows = []
+    n_features = base.shape[1]
+    for mask in itertools.product([False, True], repeat=n_features):
+        if any(mask):
+            X = base.copy()
+            X[:, np.array(mask)] = np.nan
+            rows.append(X)
+    return np.vstack(rows)
+
+
+def limit_inputs(ranges, feature_names):
+    # Corners of the UI ranges and of the batch normalizer's valid ranges
+    corners = []
+    for limits in (ranges, {name: NORMALIZATION_SCHEMA[name]["valid_range"] for name in feature_names}):
+        corners.extend(itertools.product(*[limits[name] for name in feature_names]))
+    return np.array(corners, dtype=float)
+
+
+def boundary_inputs(model, base, reference_scores):
+    # Single-feature moves that land exactly on the 30/45/60 thresholds,
+    # plus their nearest representable neighbours on both sides
+    cf = category_counterfactuals(model, base, reference_scores)
+    targets = cf["target"]
+    rows = []
+    n_subjects, n_bounds, n_features = targets.shape
+    for b in range(n_bounds):
+        for j in range(n_features):
+            X = cf["values"].copy()
+            X[:, j] = targets[:, b, j]
+            for value in (X[:, j], np.nextafter(X[:, j], -np.inf), np.nextafter(X[:, j], np.inf)):
+                moved = X.copy()
+                moved[:, j] = value
+                rows.append(moved)
+    X = np.vstack(rows)
+    return X[np.isfinite(X).all(axis=1) & (X >= 0).all(axis=1)]
+
+
+def boundary_scores(reference_scores):
+    # Every reference score and its neighbours: each is a step of the percentile function
+    return np.unique(np.concatenate([
+        reference_scores,
+        np.nextafter(reference_scores, -np.inf),
+        np.nextafter(reference_scores, np.inf),
+        band_threshold_scores(reference_scores),
+        [0.0, 1.0]
+    ]))
+
+
+# ======================================================
+# COMPARISONS
+# ======================================================
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def compare_chain(reference, model, reference_scores, X, inputs):
+
+    rows = []
+
+    ref_scores, ref_score_s = timed(reference.scores, X)
+    ref_pct, ref_pct_s = timed(reference.percentiles, ref_scores)
+    ref_cat, ref_cat_s = timed(reference.categories, ref_pct)
+
+    fast_scores, fast_score_s = timed(predict_scores, model, X)
+    rows.append({
+        "path": "predict_scores",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": float(np.max(np.abs(fast_scores - ref_scores))),
+        "percentile_mismatches": int((reference.percentiles(fast_scores) != ref_pct).sum()),
+        "category_mismatches": None,
+        "reference_s": ref_score_s,
+        "fast_s": fast_score_s
+    })
+
+    fast_pct, fast_pct_s = timed(scores_to_percentiles, ref_scores, reference_scores)
+    rows.append({
+        "path": "scores_to_percentiles",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": None,
+        "percentile_mismatches": int((fast_pct != ref_pct).sum()),
+        "category_mismatches": None,
+        "reference_s": ref_pct_s,
+        "fast_s": fast_pct_s
+    })
+
+    fast_cat, fast_cat_s = timed(percentiles_to_category_codes, ref_pct)
+    rows.append({
+        "path": "percentiles_to_category_codes",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": None,
+        "percentile_mismatches": None,
+        "category_mismatches": int((fast_cat != ref_cat).sum()),
+        "reference_s": ref_cat_s,
+        "fast_s": fast_cat_s
+    })
+
+    ref_shares, ref_shares_s = timed(reference.shares, X)
+    (_, fast_shares), fast_shares_s = timed(contribution_shares, model, X)
+    rows.append({
+        "path": "contribution_shares",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": None,
+        "max_share_error": float(np.max(np.abs(fast_shares - ref_shares))),
+        "percentile_mismatches": None,
+        "category_mismatches": None,
+        "reference_s": ref_shares_s,
+        "fast_s": fast_shares_s
+    })
+
+    batch, batch_s = timed(score_batch, model, X, reference_scores)
+    rows.append({
+        "path": "score_batch",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": float(np.max(np.abs(batch["score"] - ref_scores))),
+        "max_share_error": float(np.max(np.abs(batch["shares"] - ref_shares))),
+        "percentile_mismatches": int((batch["percentile"] != ref_pct).sum()),
+        "category_mismatches": int((batch["category_code"] != ref_cat).sum()),
+        "reference_s": ref_score_s + ref_pct_s + ref_cat_s + ref_shares_s,
+        "fast_s": batch_s
+    })
+
+    # float32 mode: exact by rescoring near reference steps; without the
+    # rescoring its mismatch rate is measured but not held to zero
+    for exact in (True, False):
+        batch, batch_s = timed(
+            lambda: score_batch(model, X, reference_scores, dtype=np.float32, compact=True, exact=exact)
+        )
+        rows.append({
+            "path": "score_batch float32" + ("" if exact else " (no rescoring)"),
+            "inputs": inputs,
+            "rows": len(X),
+            "max_prob_error": float(np.max(np.abs(batch["score"] - ref_scores))),
+            "max_share_error": float(np.max(np.abs(batch["shares"] - ref_shares))),
+            "percentile_mismatches": int((batch["percentile"] != ref_pct).sum()),
+            "category_mismatches": int((batch["category_code"] != ref_cat).sum()),
+            "rescored": batch["rescored"],
+            "exact": exact,
+            "reference_s": ref_score_s + ref_pct_s + ref_cat_s + ref_shares_s,
+            "fast_s": batch_s
+        })
+
+    return rows
+
+
+def compare_single_rows(reference, model, X, inputs):
+    # The app scores one subject per predict_proba call; BLAS can sum a
+    # single row differently from a batch, so that path is checked too
+    start = time.perf_counter()
+    ref_scores = np.array([reference.scores(row[None, :])[0] for row in X])
+    ref_s = time.perf_counter() - start
+
+    fast_scores, fast_s = timed(lambda: np.array([predict_scores(model, row)[0] for row in X]))
+    return [{
+        "path": "predict_scores (one row)",
+        "inputs": inputs,
+        "rows": len(X),
+        "max_prob_error": float(np.max(np.abs(fast_scores - ref_scores))),
+        "percentile_mismatches": int(
+            (reference.percentiles(fast_scores) != reference.percentiles(ref_scores)).sum()
+        ),
+        "category_mismatches": None,
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    }]
+
+
+def compare_percentile_steps(reference, reference_scores):
+
+    scores = boundary_scores(reference_scores)
+    ref_pct, ref_s = timed(reference.percentiles, scores)
+    fast_pct, fast_s = timed(scores_to_percentiles, scores, reference_scores)
+
+    return [{
+        "path": "scores_to_percentiles",
+        "inputs": "reference steps",
+        "rows": len(scores),
+        "max_prob_error": None,
+        "percentile_mismatches": int((fast_pct != ref_pct).sum()),
+        "category_mismatches": int(
+            (percentiles_to_category_codes(fast_pct) != reference.categories(ref_pct)).sum()
+        ),
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    }]
+
+
+def synthetic_strata(model, reference_scores, X, rng, directory):
+    # Used when the bundle has no strata: random ages/sexes over scored
+    # inputs, packed and memory-mapped exactly as build_bundle.py does
+    age_edges = [40.0, 60.0]
+    packed, index = build_stratified_reference(
+        reference_scores,
+        predict_scores(model, X),
+        rng.uniform(18, 85, len(X)),
+        rng.choice([1, 2], len(X)),
+        age_edges,
+        min_size=len(X) // 12
+    )
+    path = Path(directory) / STRATA_PATH.name
+    np.save(path, packed)
+    return load_stratified_reference({
+        "offsets": index["offsets"].tolist(),
+        "slots": index["slots"].tolist(),
+        "age_edges": age_edges,
+        "sex_codes": [1, 2],
+        "sex_labels": ["male", "female"]
+    }, reference_scores, path)
+
+
+def compare_stratified(reference, strata, rng, n_random, inputs):
+
+    # Every step of every stratum, plus random scores in randomly mixed strata
+    n_segments = len(strata["sizes"])
+    parts = [boundary_scores(np.asarray(stratum_scores(strata, k))) for k in range(n_segments)]
+    scores = np.concatenate(parts + [rng.uniform(0, 1, n_random)])
+    segments = np.concatenate(
+        [np.full(len(part), k) for k, part in enumerate(parts)]
+        + [rng.integers(0, n_segments, n_random)]
+    )
+
+    fast_pct, fast_s = timed(stratified_percentiles, scores, strata, segments)
+    start = time.perf_counter()
+    segment_scores = [np.asarray(stratum_scores(strata, k)) for k in range(n_segments)]
+    ref_pct = np.array([
+        reference.score_to_percentile(score, reference_scores=segment_scores[k])
+        for score, k in zip(scores, segments)
+    ], dtype=int)
+    ref_s = time.perf_counter() - start
+
+    return [{
+        "path": "stratified_percentiles",
+        "inputs": f"{inputs} ({n_segments} segments)",
+        "rows": len(scores),
+        "max_prob_error": None,
+        "percentile_mismatches": int((fast_pct != ref_pct).sum()),
+        "category_mismatches": int(
+            (percentiles_to_category_codes(fast_pct) != reference.categories(ref_pct)).sum()
+        ),
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    }]
+
+
+def compare_stratified_batch(reference, model, reference_scores, strata, X, rng):
+
+    segments = rng.integers(0, len(strata["sizes"]), len(X))
+    start = time.perf_counter()
+    ref_scores = reference.scores(X)
+    segment_scores = [np.asarray(stratum_scores(strata, k)) for k in range(len(strata["sizes"]))]
+    ref_pct = np.array([
+        reference.score_to_percentile(score, reference_scores=segment_scores[k])
+        for score, k in zip(ref_scores, segments)
+    ], dtype=int)
+    ref_cat = reference.categories(ref_pct)
+    ref_s = time.perf_counter() - start
+
+    rows = []
+    for dtype in (np.float64, np.float32):
+        batch, fast_s = timed(
+            lambda: score_batch(model, X, reference_scores, dtype=dtype, strata=strata, segments=segments)
+        )
+        rows.append({
+            "path": f"score_batch[{np.dtype(dtype).name}, strata]",
+            "inputs": "random, mixed strata",
+            "rows": len(X),
+            "max_prob_error": float(np.max(np.abs(batch["score"] - ref_scores))),
+            "percentile_mismatches": int((batch["percentile"] != ref_pct).sum()),
+            "category_mismatches": int((batch["category_code"] != ref_cat).sum()),
+            "rescored": batch["rescored"],
+            "reference_s": ref_s,
+            "fast_s": fast_s
+        })
+    return rows
+
+
+def compare_band_thresholds(reference, reference_scores):
+
+    thresholds, fast_s = timed(band_threshold_scores, reference_scores)
+    start = time.perf_counter()
+    # Each threshold must be the first score in its band: itself inside, the next lower float below
+    at = reference.categories(reference.percentiles(thresholds))
+    below = reference.categories(reference.percentiles(np.nextafter(thresholds, -np.inf)))
+    ref_s = time.perf_counter() - start
+
+    expected = np.arange(1, len(CATEGORY_BOUNDS) + 1)
+    return [{
+        "path": "band_threshold_scores",
+        "inputs": "30/45/60",
+        "rows": len(thresholds),
+        "max_prob_error": None,
+        "percentile_mismatches": None,
+        "category_mismatches": int((at != expected).sum() + (below != expected - 1).sum()),
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    }]
+
+
+def compare_counterfactuals(reference, model, reference_scores, base):
+
+    cf, fast_s = timed(category_counterfactuals, model, base, reference_scores)
+    targets = cf["target"]
+    n_subjects, n_bounds, n_features = targets.shape
+
+    moved = np.repeat(cf["values"][:, None, None, :], n_bounds, axis=1).repeat(n_features, axis=2)
+    idx = np.arange(n_features)
+    moved[:, :, idx, idx] = targets
+    moved = moved.reshape(-1, n_features)
+    expected = np.broadcast_to(cf["threshold_scores"][None, :, None], targets.shape).ravel()
+
+    # Targets can leave the physiologic range (even go negative); the model is still defined there
+    scores, ref_s = timed(reference.scores, moved)
+    return [{
+        "path": "category_counterfactuals",
+        "inputs": "threshold targets",
+        "rows": len(moved),
+        "max_prob_error": float(np.max(np.abs(scores - expected))),
+        "percentile_mismatches": None,
+        "category_mismatches": None,
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    }]
+
+
+def compare_risk_surface(reference, model, reference_scores, base, resolution):
+
+    names = reference.feature_names
+    ranges = reference.input_ranges
+    rows = []
+    mismatched_pct = mismatched_cat = n = 0
+    ref_s = fast_s = 0.0
+
+    for values in base:
+        for x_index, y_index in itertools.permutations(range(len(names)), 2):
+            surface, elapsed = timed(
+                risk_surface, model, reference_scores, values, x_index, y_index,
+                ranges[names[x_index]], ranges[names[y_index]], resolution
+            )
+            fast_s += elapsed
+
+            start = time.perf_counter()
+            gx, gy = np.meshgrid(surface["x"], surface["y"])
+            grid = np.tile(values, (gx.size, 1))
+            grid[:, x_index] = gx.ravel()
+            grid[:, y_index] = gy.ravel()
+            ref_pct = reference.percentiles(reference.scores(grid))
+            ref_cat = reference.categories(ref_pct)
+            ref_s += time.perf_counter() - start
+
+            mismatched_pct += int((surface["percentiles"].ravel() != ref_pct).sum())
+            mismatched_cat += int((surface["categories"].ravel() != ref_cat).sum())
+            n += gx.size
+
+    rows.append({
+        "path": "risk_surface",
+        "inputs": f"{len(base)} profiles x all axis pairs",
+        "rows": n,
+        "max_prob_error": None,
+        "percentile_mismatches": mismatched_pct,
+        "category_mismatches": mismatched_cat,
+        "reference_s": ref_s,
+        "fast_s": fast_s
+    })
+    return rows
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check fast scoring paths against the app's reference chain.")
+    parser.add_argument("--grid", type=int, default=24, help="Grid points per biomarker for the full sweep")
+    parser.add_argument("--random", type=int, default=100_000, help="Randomized inputs")
+    parser.add_argument("--surface-profiles", type=int, default=3)
+    parser.add_argument("--surface-resolution", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Optional CSV for the report")
+    args = parser.parse_args()
+
+    model = joblib.load(MODELS_DIR / "emra_pipeline.joblib")
+    reference_scores = np.load(MODELS_DIR / "reference_scores.npy")
+    with open(MODELS_DIR / "emra_metadata.json", "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    feature_names = metadata["features"]
+
+    reference = ReferencePath(model, reference_scores, feature_names)
+    ranges = reference.input_ranges
+    rng = np.random.default_rng(args.seed)
+    profiles = random_inputs(ranges, feature_names, 200, rng, widen=0.0)
+
+    input_sets = {
+        "grid": grid_inputs(ranges, feature_names, args.grid),
+        "random": random_inputs(ranges, feature_names, args.random, rng),
+        "nan": nan_inputs(profiles),
+        "limits": limit_inputs(ranges, feature_names),
+        "band boundaries": boundary_inputs(model, profiles, reference_scores)
+    }
+
+    rows = []
+    for name, X in input_sets.items():
+        rows.extend(compare_chain(reference, model, reference_scores, X, name))
+    for name in ("limits", "band boundaries"):
+        rows.extend(compare_single_rows(reference, model, input_sets[name], name))
+    rows.extend(compare_percentile_steps(reference, reference_scores))
+    rows.extend(compare_band_thresholds(reference, reference_scores))
+
+    strata = load_stratified_reference(metadata.get("reference_strata"), reference_scores)
+    with tempfile.TemporaryDirectory() as directory:
+        if strata is None:
+            strata = synthetic_strata(model, reference_scores, input_sets["random"][:12_000], rng, directory)
+            inputs = "synthetic strata"
+        else:
+            inputs = "bundle strata"
+        rows.extend(compare_stratified(reference, strata, rng, 20_000, inputs))
+        rows.extend(compare_stratified_batch(
+            reference, model, reference_scores, strata, input_sets["random"][-20_000:], rng
+        ))
+        del strata
+    rows.extend(compare_counterfactuals(reference, model, reference_scores, profiles))
+    rows.extend(compare_risk_surface(
+        reference, model, reference_scores, profiles[:args.surface_profiles], args.surface_resolution
+    ))
+
+    report = pd.DataFrame(rows, columns=[
+        "path", "inputs", "rows", "max_prob_error", "max_share_error",
+        "percentile_mismatches", "category_mismatches", "rescored", "exact", "reference_s", "fast_s"
+    ])
+    report["exact"] = report["exact"].fillna(True).astype(bool)
+    report["speedup"] = (report["reference_s"] / report["fast_s"]).round(1)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.to_string(index=False, float_format=lambda v: f"{v:.3g}"))
+    if args.out:
+        report.to_csv(args.out, index=False)
+
+    counts = report[["percentile_mismatches", "category_mismatches"]].fillna(0).sum(axis=1)
+    mismatches = counts[report["exact"]].sum()
+    print(f"\n{int(mismatches)} percentile/category mismatches across {int(report['exact'].sum())} exact comparisons")
+
+    inexact = report[~report["exact"]]
+    if len(inexact):
+        rate = counts[~report["exact"]].sum() / inexact["rows"].sum()
+        print(f"Mismatch rate without float32 rescoring, all input sets pooled: {rate:.2e} of rows")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+import pandas as pd
+
+# ======================================================
+# CHUNKED RESULT EXPORT (CSV / XLSX)
+# ======================================================
+# Writers take an iterable of result DataFrames (e.g. the batches from
+# ingest.score_stream) and write them chunk by chunk, so memory does not
+# grow with the number of rows exported.
+
+EXPORT_CHUNK_ROWS = 5000
+
+INTERPRETATION_COLUMNS = ["category_code", "category", "interpretation", "why_this_matters", "drivers"]
+
+
+def iter_chunks(frames, chunk_rows=EXPORT_CHUNK_ROWS):
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for frame in frames:
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+
+
+def interpretation_rows(interpretations):
+    # interpretations: {category_code: percentile_to_demo_output(...) dict}
+    return [
+        [
+            code,
+            demo["category"],
+            demo["interpretation"],
+            demo["why_this_matters"],
+            "; ".join(demo["drivers"])
+        ]
+        for code, demo in sorted(interpretations.items())
+    ]
+
+
+def write_csv(frames, f, chunk_rows=EXPORT_CHUNK_ROWS):
+    header = True
+    for chunk in iter_chunks(frames, chunk_rows):
+        chunk.to_csv(f, header=header, index=False)
+        f.flush()
+        header = False
+
+
+def write_xlsx(frames, f, interpretations=None, chunk_rows=EXPORT_CHUNK_ROWS):
+
+    import xlsxwriter
+
+    # constant_memory flushes each row to a temp file once the next row starts
+    workbook = xlsxwriter.Workbook(f, {"constant_memory": True})
+    results = workbook.add_worksheet("results")
+    header_format = workbook.add_format({"bold": True})
+    datetime_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm"})
+
+    row = 0
+    for chunk in iter_chunks(frames, chunk_rows):
+        if row == 0:
+            results.write_row(0, 0, list(chunk.columns), header_format)
+            row = 1
+
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for record in values.itertuples(index=False):
+            for col, value in enumerate(record):
+                if value is None:
+                    continue
+                if isinstance(value, pd.Timestamp):
+                    results.write_datetime(row, col, value.to_pydatetime(), datetime_format)
+                else:
+                    results.write(row, col, value)
+            row += 1
+
+    if interpretations:
+        lookup = workbook.add_worksheet("interpretations")
+        lookup.write_row(0, 0, INTERPRETATION_COLUMNS, header_format)
+        for i, values in enumerate(interpretation_rows(interpretations), start=1):
+            lookup.write_row(i, 0, values)
+
+    workbook.close()
+
+
+def export_file(frames, kind, interpretations=None):
+    # Built into a temp file on disk and handed back as an open reader,
+    # so the export is never materialized as one in-memory buffer.
+    suffix = ".xlsx" if kind == "xlsx" else ".csv"
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    os.close(handle)
+
+    try:
+        if kind == "xlsx":
+            write_xlsx(frames, path, interpretations)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                write_csv(frames, f)
+        return open(path, "rb")
+    finally:
+        os.unlink(path)
@@ -0,0 +1,472 @@
+import argparse
+import json
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from export import write_csv, write_xlsx
+from normalize import normalize_inputs
+from scoring import measurement_uncertainty, score_batch
+
+# ======================================================
+# LOINC MAPPING
+# ======================================================
+# Height and weight are kept so normalize_inputs can derive BMI when
+# no BMI observation is reported. The model expects fasting glucose, so
+# only fasting codes map to LBXGLU by default.
+
+LOINC_MAP = {
+    "1558-6": "LBXGLU",    # Fasting glucose [Mass/volume] in Serum or Plasma
+    "14771-0": "LBXGLU",   # Fasting glucose [Moles/volume] in Serum or Plasma
+    "4548-4": "LBXGH",     # Hemoglobin A1c/Hemoglobin.total in Blood
+    "17856-6": "LBXGH",    # Hemoglobin A1c/Hemoglobin.total in Blood by HPLC
+    "59261-8": "LBXGH",    # Hemoglobin A1c/Hemoglobin.total in Blood by IFCC
+    "2571-8": "LBXTR",     # Triglyceride [Mass/volume] in Serum or Plasma
+    "14927-8": "LBXTR",    # Triglyceride [Moles/volume] in Serum or Plasma
+    "39156-5": "BMXBMI",   # Body mass index
+    "8302-2": "height",    # Body height
+    "29463-7": "weight"    # Body weight
+}
+
+# Glucose of unknown fasting status; only used with generic_glucose=True
+# (--generic-glucose) and counted separately either way
+GENERIC_GLUCOSE_CODES = {
+    "2345-7": "LBXGLU"     # Glucose [Mass/volume] in Serum or Plasma
+}
+
+LOINC_SYSTEM = "http://loinc.org"
+
+# UCUM codes that differ from the unit names used in normalize.py
+UCUM_UNITS = {
+    "[lb_av]": "lb",
+    "[in_i]": "in",
+    "kg/m2": "kg/m2"
+}
+
+CHUNK_SIZE = 1 << 16
+
+
+def _unit(unit):
+    if not unit:
+        return None
+    unit = str(unit).strip()
+    return UCUM_UNITS.get(unit, unit.lower())
+
+
+def _count(counts, rule):
+    counts[rule] = counts.get(rule, 0) + 1
+
+
+def _loinc_feature(codes, generic_glucose, counts):
+    # Fasting / specific codes win over a generic glucose code on the same observation
+    for code in codes:
+        if code in LOINC_MAP:
+            return LOINC_MAP[code]
+    for code in codes:
+        if code in GENERIC_GLUCOSE_CODES:
+            if not generic_glucose:
+                _count(counts, "LBXGLU:skipped_generic_glucose")
+                return None
+            _count(counts, "LBXGLU:generic_glucose")
+            return GENERIC_GLUCOSE_CODES[code]
+    return None
+
+
+def _utc(value):
+    # Observations are compared in naive UTC so mixed offsets stay comparable
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# ======================================================
+# FHIR (JSON BUNDLE / NDJSON)
+# ======================================================
+
+def _iter_bundle_entries(f):
+    # Incremental decode of Bundle.entry[]: only the current entry and one
+    # read chunk are ever held in memory.
+    decoder = json.JSONDecoder()
+    start = re.compile(r'"entry"\s*:\s*\[')
+    buffer = ""
+
+    while True:
+        match = start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        buffer = buffer[-32:] + chunk
+
+    separators = re.compile(r"[\s,]*")
+    pos = 0
+
+    while True:
+        pos = separators.match(buffer, pos).end()
+
+        if pos == len(buffer):
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer, pos = chunk, 0
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, pos_end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                raise
+            # Drop what has been consumed before growing the buffer
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        yield item.get("resource", item)
+        pos = pos_end
+
+
+def _iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _fhir_time(value):
+    # FHIR dateTime may be partial ("2023", "2023-05"); pad it to the start of that period
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if re.fullmatch(r"\d{4}", value):
+        value += "-01-01"
+    elif re.fullmatch(r"\d{4}-\d{2}", value):
+        value += "-01"
+    try:
+        return _utc(datetime.fromisoformat(value))
+    except ValueError:
+        return None
+
+
+def _fhir_observation(resource, counts, generic_glucose=False):
+
+    if resource.get("resourceType") != "Observation":
+        return None
+
+    codes = [
+        coding.get("code")
+        for coding in resource.get("code", {}).get("coding", [])
+        if coding.get("system", LOINC_SYSTEM) == LOINC_SYSTEM
+    ]
+    feature = _loinc_feature(codes, generic_glucose, counts)
+
+    quantity = resource.get("valueQuantity")
+    if feature is None or quantity is None or "value" not in quantity:
+        return None
+
+    patient = resource.get("subject", {}).get("reference")
+    when = (
+        resource.get("effectiveDateTime")
+        or resource.get("effectiveInstant")
+        or resource.get("effectivePeriod", {}).get("start")
+        or resource.get("issued")
+    )
+    if patient is None or when is None:
+        return None
+
+    time = _fhir_time(when)
+    if time is None:
+        # One malformed timestamp must not abort the whole stream
+        _count(counts, "observation:rejected_bad_time")
+        return None
+
+    return {
+        "patient": patient.split("/")[-1],
+        "time": time,
+        "feature": feature,
+        "value": quantity["value"],
+        "unit": _unit(quantity.get("code") or quantity.get("unit"))
+    }
+
+
+def read_fhir_observations(path, counts=None, generic_glucose=False):
+    path = Path(path)
+    counts = {} if counts is None else counts
+    with open(path, "r", encoding="utf-8") as f:
+        resources = _iter_ndjson(f) if path.suffix == ".ndjson" else _iter_bundle_entries(f)
+        for resource in resources:
+            observation = _fhir_observation(resource, counts, generic_glucose)
+            if observation is not None:
+                yield observation
+
+
+# ======================================================
+# HL7 v2 (ORU^R01)
+# ======================================================
+
+HL7_TIME = re.compile(r"(\d{8}|\d{10}|\d{12}|\d{14})(?:\.\d{1,4})?([+-]\d{4})?")
+
+
+def _hl7_time(value):
+    # YYYYMMDD[HH[MM[SS[.S]]]][+/-ZZZZ]; an offset is converted to UTC like FHIR times
+    match = HL7_TIME.fullmatch(value.strip())
+    if match is None:
+        return None
+    digits, offset = match.groups()
+    try:
+        if offset:
+            return _utc(datetime.strptime(digits.ljust(14, "0") + offset, "%Y%m%d%H%M%S%z"))
+        return datetime.strptime(digits.ljust(14, "0"), "%Y%m%d%H%M%S")
+    except ValueError:
+        # e.g. month 13: drop the observation, not the stream
+        return None
+
+
+def _iter_hl7_segments(f):
+    # Segments end in \r (sometimes \n); read in chunks, never whole files
+    pending = ""
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        segments = re.split(r"[\r\n]+", pending)
+        pending = segments.pop()
+        for segment in segments:
+            if segment:
+                yield segment
+    if pending:
+        yield pending
+
+
+def read_hl7_observations(path, counts=None, generic_glucose=False):
+
+    counts = {} if counts is None else counts
+    field_sep, component_sep = "|", "^"
+    patient = None
+    request_time = None
+    request_time_bad = False
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for segment in _iter_hl7_segments(f):
+
+            kind = segment[:3]
+
+            if kind == "MSH":
+                field_sep = segment[3]
+                component_sep = segment[4]
+                patient = None
+                request_time = None
+                request_time_bad = False
+                continue
+
+            fields = segment.split(field_sep)
+
+            if kind == "PID" and len(fields) > 3:
+                patient = fields[3].split(component_sep)[0] or None
+            elif kind == "OBR" and len(fields) > 7:
+                request_time = _hl7_time(fields[7]) if fields[7] else None
+                request_time_bad = bool(fields[7]) and request_time is None
+            elif kind == "OBX" and len(fields) > 5 and patient is not None:
+                identifier = fields[3].split(component_sep)
+                feature = _loinc_feature([identifier[0]], generic_glucose, counts)
+                if feature is None:
+                    continue
+                try:
+                    value = float(fields[5])
+                except ValueError:
+                    continue
+                if len(fields) > 14 and fields[14]:
+                    when = _hl7_time(fields[14])
+                    bad_time = when is None
+                else:
+                    when = request_time
+                    bad_time = request_time_bad
+                if when is None:
+                    if bad_time:
+                        _count(counts, "observation:rejected_bad_time")
+                    continue
+                yield {
+                    "patient": patient,
+                    "time": when,
+                    "feature": feature,
+                    "value": value,
+                    "unit": _unit(fields[6].split(component_sep)[0]) if len(fields) > 6 else None
+                }
+
+
+def read_observations(path, counts=None, generic_glucose=False):
+    # counts, when given, collects observations dropped or flagged while reading
+    path = Path(path)
+    if path.suffix.lower() in (".hl7", ".txt"):
+        return read_hl7_observations(path, counts, generic_glucose)
+    return read_fhir_observations(path, counts, generic_glucose)
+
+
+# ======================================================
+# PER-PATIENT PANELS
+# ======================================================
+# Observations of one patient within `window` of the panel's first
+# observation are joined into one assessment row. At most `max_open`
+# panels are held; the least recently updated one is emitted when the
+# limit is reached, which keeps memory bounded for any file size.
+
+def join_panels(observations, window=timedelta(days=30), max_open=10_000):
+
+    open_panels = OrderedDict()
+
+    def emit(panel):
+        row = {"patient": panel["patient"], "window_start": panel["start"], "window_end": panel["end"]}
+        for feature, (value, unit, _) in panel["values"].items():
+            row[feature] = value
+            row[feature + "_unit"] = unit
+        return row
+
+    for obs in observations:
+        panel = open_panels.get(obs["patient"])
+
+        if panel is not None and abs(obs["time"] - panel["start"]) > window:
+            yield emit(open_panels.pop(obs["patient"]))
+            panel = None
+
+        if panel is None:
+            if len(open_panels) >= max_open:
+                _, oldest = open_panels.popitem(last=False)
+                yield emit(oldest)
+            panel = {"patient": obs["patient"], "start": obs["time"], "end": obs["time"], "values": {}}
+            open_panels[obs["patient"]] = panel
+        else:
+            open_panels.move_to_end(obs["patient"])
+
+        # Latest observation of a biomarker within the window wins
+        previous = panel["values"].get(obs["feature"])
+        if previous is None or obs["time"] >= previous[2]:
+            panel["values"][obs["feature"]] = (obs["value"], obs["unit"], obs["time"])
+
+        panel["start"] = min(panel["start"], obs["time"])
+        panel["end"] = max(panel["end"], obs["time"])
+
+    for panel in open_panels.values():
+        yield emit(panel)
+
+
+def panel_batches(panels, batch_size=1000):
+    batch = []
+    for panel in panels:
+        batch.append(panel)
+        if len(batch) == batch_size:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+# ======================================================
+# SCORING STREAM
+# ======================================================
+
+def score_stream(path, model, reference_scores, feature_names, batch_size=1000,
+                 window=timedelta(days=30), max_open=10_000, dtype=np.float64, compact=False,
+                 generic_glucose=False, with_uncertainty=False):
+
+    read_counts = {}
+    panels = join_panels(read_observations(path, read_counts, generic_glucose), window=window, max_open=max_open)
+
+    for batch in panel_batches(panels, batch_size):
+        normalized = normalize_inputs(batch, feature_names)
+        accepted = normalized["accepted"]
+
+        # score_batch rounds to dtype itself, so float32 results still match float64 scoring
+        X = normalized["X"][accepted].to_numpy()
+        scored = score_batch(model, X, reference_scores, dtype=dtype, compact=compact)
+
+        results = batch.loc[accepted, ["patient", "window_start", "window_end"]].reset_index(drop=True)
+        results[feature_names] = X.astype(dtype)
+        results["score"] = scored["score"]
+        results["percentile"] = scored["percentile"]
+        results["category_code"] = scored["category_code"]
+
+        if with_uncertainty:
+            mc = measurement_uncertainty(model, X, feature_names, reference_scores)
+            results["percentile_low"] = mc["low"]
+            results["percentile_high"] = mc["high"]
+            for code in range(mc["category_probs"].shape[1]):
+                results[f"category_prob_{code}"] = np.round(mc["category_probs"][:, code], 3)
+
+        # Reader rejections are reported with the batch they were counted in
+        counts = dict(normalized["counts"])
+        for rule, count in read_counts.items():
+            counts[rule] = counts.get(rule, 0) + count
+        read_counts.clear()
+
+        yield results, counts
+
+
+def main():
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Score FHIR / HL7 v2 lab exports in bounded memory.")
+    parser.add_argument("path", help="FHIR Bundle (.json), FHIR bulk export (.ndjson) or HL7 v2 file (.hl7)")
+    parser.add_argument("--out", required=True, help="CSV or XLSX file for scored panels")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--max-open", type=int, default=10_000)
+    parser.add_argument("--float32", action="store_true",
+                        help="Score in float32; percentiles and categories still match float64")
+    parser.add_argument("--generic-glucose", action="store_true",
+                        help="Also use LOINC 2345-7 glucose of unknown fasting status as fasting glucose")
+    parser.add_argument("--compact", action="store_true",
+                        help="Store percentile and category as 8-bit integer codes")
+    parser.add_argument("--uncertainty", action="store_true",
+                        help="Add a 5-95%% measurement-uncertainty percentile interval and "
+                             "per-category probabilities (~1 s per 1,000 panels)")
+    args = parser.parse_args()
+
+    models_dir = Path("models")
+    model = joblib.load(models_dir / "emra_pipeline.joblib")
+    reference_scores = np.load(models_dir / "reference_scores.npy")
+    with open(models_dir / "emra_metadata.json", "r", encoding="utf-8") as f:
+        feature_names = json.load(f)["features"]
+
+    totals = {}
+    n_rows = 0
+
+    def batches():
+        nonlocal n_rows
+        for results, counts in score_stream(
+            args.path, model, reference_scores, feature_names,
+            batch_size=args.batch_size,
+            window=timedelta(days=args.window_days),
+            max_open=args.max_open,
+            dtype=np.float32 if args.float32 else np.float64,
+            compact=args.compact,
+            generic_glucose=args.generic_glucose,
+            with_uncertainty=args.uncertainty
+        ):
+            n_rows += len(results)
+            for rule, count in counts.items():
+                totals[rule] = totals.get(rule, 0) + count
+            yield results
+
+    if args.out.endswith(".xlsx"):
+        write_xlsx(batches(), args.out)
+    else:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_csv(batches(), f)
+
+    print(f"Scored {n_rows} panels -> {args.out}")
+    for rule, count in sorted(totals.items()):
+        print(f"  {rule}: {count}")
+
+
+if __name__ == "__main__":
+    main()
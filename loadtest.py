@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+# ======================================================
+# CONCURRENT-SESSION LOAD TEST
+# ======================================================
+# Drives headless sessions of app.py over Streamlit's own websocket
+# protocol, the same way a browser tab does. For every session count a
+# fresh local server is started, so the peak memory reported belongs to
+# that level alone. Nothing leaves the machine.
+
+ASSESS_LABEL = "Assess metabolic pattern"
+PDF_LABEL = "Download PDF Report"
+BUSY_MARKER = "server is busy"
+
+APP_PATH = Path(__file__).with_name("app.py")
+
+
+# ======================================================
+# LOCAL SERVER
+# ======================================================
+
+def start_server(port, startup_timeout=60.0):
+    env = dict(os.environ, EMRA_METRICS_PORT="0")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.address", "127.0.0.1",
+            "--browser.gatherUsageStats", "false"
+        ],
+        cwd=APP_PATH.parent,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    wait_for_server(process, port, startup_timeout)
+    return process
+
+
+def server_healthy(port, timeout=1.0):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def wait_for_server(process, port, startup_timeout=60.0):
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if server_healthy(port):
+            return
+        if process.poll() is not None:
+            break
+        time.sleep(0.25)
+
+    process.kill()
+    raise RuntimeError(f"Streamlit server did not come up on port {port}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def peak_memory_mb(pid):
+    # VmHWM: peak resident set of the server process since it started
+    with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return np.nan
+
+
+# ======================================================
+# ONE SIMULATED SESSION
+# ======================================================
+
+async def rerun(ws, widget_states, timeout, query_string=""):
+    message = BackMsg()
+    message.rerun_script.query_string = query_string
+    message.rerun_script.widget_states.widgets.extend(widget_states)
+    await ws.send(message.SerializeToString())
+
+    elements = []
+    while True:
+        forward = ForwardMsg()
+        forward.ParseFromString(await asyncio.wait_for(ws.recv(), timeout))
+        kind = forward.WhichOneof("type")
+        if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+            elements.append(forward.delta.new_element)
+        elif kind == "script_finished":
+            return elements, forward.script_finished
+
+
+def find_widgets(elements, kind):
+    return [getattr(e, kind) for e in elements if e.WhichOneof("type") == kind]
+
+
+def random_inputs(number_inputs, rng):
+    # Values stay inside each widget's own min/max, rounded to its step
+    states = []
+    for widget in number_inputs:
+        step = widget.step or 1.0
+        value = rng.uniform(widget.min, widget.max)
+        states.append(WidgetState(id=widget.id, double_value=round(round(value / step) * step, 2)))
+    return states
+
+
+def fetch(url, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return len(response.read())
+
+
+async def run_session(port, n_requests, download_pdf, seed, timeout):
+
+    rng = random.Random(seed)
+    records = []
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        async with websockets.connect(
+            f"ws://127.0.0.1:{port}/_stcore/stream",
+            subprotocols=["streamlit"],
+            max_size=None
+        ) as ws:
+
+            elements, _ = await rerun(ws, [], timeout)
+            number_inputs = find_widgets(elements, "number_input")
+            assess = [b for b in find_widgets(elements, "button") if b.label == ASSESS_LABEL][0]
+
+            for _ in range(n_requests):
+                states = random_inputs(number_inputs, rng)
+                states.append(WidgetState(id=assess.id, trigger_value=True))
+
+                record = {"outcome": "ok", "pdf_s": np.nan}
+                start = time.perf_counter()
+                try:
+                    elements, finished = await rerun(ws, states, timeout)
+                except asyncio.TimeoutError:
+                    record.update(outcome="timeout", latency_s=time.perf_counter() - start)
+                    records.append(record)
+                    break
+                record["latency_s"] = time.perf_counter() - start
+
+                alerts = [a.body for a in find_widgets(elements, "alert")]
+                if finished != ForwardMsg.FINISHED_SUCCESSFULLY or find_widgets(elements, "exception"):
+                    record["outcome"] = "error"
+                elif any(BUSY_MARKER in body for body in alerts):
+                    record["outcome"] = "busy"
+
+                if download_pdf and record["outcome"] == "ok":
+                    pdf = [d for d in find_widgets(elements, "download_button") if d.label == PDF_LABEL]
+                    if pdf:
+                        pdf_start = time.perf_counter()
+                        try:
+                            await asyncio.to_thread(fetch, base_url + pdf[0].url, timeout)
+                            record["pdf_s"] = time.perf_counter() - pdf_start
+                        except OSError:
+                            record["outcome"] = "pdf_error"
+                    else:
+                        record["outcome"] = "pdf_missing"
+
+                records.append(record)
+
+    except (OSError, websockets.WebSocketException, IndexError):
+        records.append({"outcome": "disconnected", "latency_s": np.nan, "pdf_s": np.nan})
+
+    return records
+
+
+# ======================================================
+# ONE LOAD LEVEL
+# ======================================================
+
+async def run_level(port, n_sessions, n_requests, download_pdf, seed, timeout, pid=None):
+
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*[
+        run_session(port, n_requests, download_pdf, seed + i, timeout)
+        for i in range(n_sessions)
+    ])
+    elapsed = time.perf_counter() - start
+
+    records = pd.DataFrame([record for session in sessions for record in session])
+    latency = records["latency_s"].dropna().to_numpy()
+    ok = records["outcome"] == "ok"
+
+    summary = {
+        "sessions": n_sessions,
+        "requests": len(records),
+        "ok": int(ok.sum()),
+        "busy": int((records["outcome"] == "busy").sum()),
+        "errors": int((~ok & (records["outcome"] != "busy")).sum()),
+        "error_rate": round(float((~ok).mean()), 4),
+        "throughput_rps": round(len(records) / elapsed, 2)
+    }
+    for q in (50, 90, 95, 99):
+        summary[f"p{q}_s"] = round(float(np.percentile(latency, q)), 3) if len(latency) else np.nan
+    summary["max_s"] = round(float(latency.max()), 3) if len(latency) else np.nan
+
+    if download_pdf:
+        pdf = records["pdf_s"].dropna()
+        summary["pdf_p50_s"] = round(float(pdf.median()), 3) if len(pdf) else np.nan
+
+    if pid:
+        summary["peak_rss_mb"] = round(peak_memory_mb(pid), 1)
+
+    return summary
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Load-test app.py with concurrent headless sessions.")
+    parser.add_argument("--sessions", default="1,5,10,25", help="Comma-separated concurrent session counts")
+    parser.add_argument("--requests", type=int, default=5, help="Assessments per session")
+    parser.add_argument("--pdf", action="store_true", help="Also download the PDF after each assessment")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--external", action="store_true",
+                        help="Use an already running server on --port instead of starting one per level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a request counts as timed out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Optional CSV for the summary table")
+    args = parser.parse_args()
+
+    rows = []
+    for n_sessions in [int(n) for n in args.sessions.split(",")]:
+        process = None if args.external else start_server(args.port)
+        try:
+            # One warm-up assessment so every level measures a warm process
+            asyncio.run(run_session(args.port, 1, False, args.seed, args.timeout))
+            summary = asyncio.run(run_level(
+                args.port, n_sessions, args.requests, args.pdf, args.seed, args.timeout,
+                pid=process.pid if process else None
+            ))
+        finally:
+            if process is not None:
+                stop_server(process)
+
+        rows.append(summary)
+        print(", ".join(f"{key}={value}" for key, value in summary.items()), flush=True)
+
+    table = pd.DataFrame(rows)
+    print()
+    print(table.to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======================================================
+# METRICS REGISTRY
+# ======================================================
+# Every thread records into its own shard, so the hot path never takes a
+# lock; shards are only summed when /metrics is scraped. Streamlit runs
+# most reruns on a fresh thread, so the shard of a finished thread is
+# folded into a retired total (on the next registration or scrape) and
+# only live threads keep a shard. Gauges are callables evaluated at
+# scrape time.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards = []
+        self._retired = self._new_shard()
+        self._shards_lock = threading.Lock()
+        self._gauges = {}
+        self._help = {}
+
+    def _new_shard(self):
+        return {
+            "counters": defaultdict(float),
+            "histograms": defaultdict(lambda: [[0] * (len(self.buckets) + 1), 0.0])
+        }
+
+    def _merge(self, target, shard):
+        for key, value in list(shard["counters"].items()):
+            target["counters"][key] += value
+        for stage, (counts, total) in list(shard["histograms"].items()):
+            merged = target["histograms"][stage]
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+
+    def _retire_finished(self):
+        # Caller holds _shards_lock; a finished thread never writes its shard again
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = live
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._new_shard()
+            self._local.shard = shard
+            # Registration happens once per thread, not per observation
+            with self._shards_lock:
+                self._retire_finished()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    # ==================================================
+    # HOT PATH
+    # ==================================================
+
+    def inc(self, name, value=1, **labels):
+        self._shard()["counters"][(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, stage, seconds):
+        histogram = self._shard()["histograms"][stage]
+        histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # ==================================================
+    # SCRAPE
+    # ==================================================
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def gauge(self, name, func, help_text=None):
+        # func returns a number or a list of (labels dict, value)
+        self._gauges[name] = func
+        if help_text:
+            self._help[name] = help_text
+
+    def render(self):
+
+        totals = self._new_shard()
+        with self._shards_lock:
+            self._retire_finished()
+            self._merge(totals, self._retired)
+            for _, shard in self._shards:
+                self._merge(totals, shard)
+        counters = totals["counters"]
+        histograms = totals["histograms"]
+
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted({name for name, _ in counters}):
+            header(name, "counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+
+        if histograms:
+            name = "emra_stage_latency_seconds"
+            header(name, "histogram")
+            for stage, (counts, total) in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {cumulative}')
+
+        for name, func in sorted(self._gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                logger.exception("Gauge %s failed", name)
+                continue
+            header(name, "gauge")
+            samples = value if isinstance(value, list) else [({}, value)]
+            for labels, sample in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {float(sample):g}")
+
+        return "\n".join(lines) + "\n"
+
+
+# ======================================================
+# LOCAL HTTP ENDPOINTS
+# ======================================================
+
+def serve_endpoints(routes, host, port, name):
+    # routes: {path: callable returning (status, body text)}
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            route = routes.get(self.path.split("?")[0])
+            if route is None:
+                self.send_error(404)
+                return
+            status, text = route()
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as error:
+        # Another replica on this host already serves the port
+        logger.warning("%s endpoint not started on %s:%s (%s)", name, host, port, error)
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"emra-{name}", daemon=True).start()
+    return server
+
+
+def start_metrics_server(metrics, host="127.0.0.1", port=9464):
+    return serve_endpoints({"/metrics": lambda: (200, metrics.render())}, host, port, "metrics")
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+# ======================================================
+# INPUT NORMALIZATION SCHEMA
+# ======================================================
+# Target units are the model's: mg/dL, NGSP %, mg/dL, kg/m².
+# Conversions are affine (value * scale + offset) so the IFCC HbA1c
+# master equation fits the same table as plain unit factors.
+
+NORMALIZATION_SCHEMA = {
+    "LBXGLU": {
+        "aliases": ["glucose", "fasting_glucose", "glu"],
+        "units": {
+            "mg/dl": (1.0, 0.0),
+            "mmol/l": (18.016, 0.0)
+        },
+        "default_unit": "mg/dl",
+        "valid_range": (20.0, 600.0)
+    },
+    "LBXGH": {
+        "aliases": ["hba1c", "a1c", "ghb"],
+        "units": {
+            "%": (1.0, 0.0),
+            "mmol/mol": (0.09148, 2.152)
+        },
+        "default_unit": "%",
+        "valid_range": (3.0, 20.0)
+    },
+    "LBXTR": {
+        "aliases": ["triglycerides", "tg", "trig"],
+        "units": {
+            "mg/dl": (1.0, 0.0),
+            "mmol/l": (88.57, 0.0)
+        },
+        "default_unit": "mg/dl",
+        "valid_range": (10.0, 5000.0)
+    },
+    "BMXBMI": {
+        "aliases": ["bmi"],
+        "units": {
+            "kg/m2": (1.0, 0.0),
+            "kg/m²": (1.0, 0.0)
+        },
+        "default_unit": "kg/m2",
+        "valid_range": (10.0, 80.0)
+    }
+}
+
+# Raw anthropometry used to derive BMI when it is not reported
+HEIGHT_SPEC = {
+    "aliases": ["height_cm"],
+    "units": {"cm": (0.01, 0.0), "m": (1.0, 0.0), "in": (0.0254, 0.0)},
+    "default_unit": "cm"
+}
+WEIGHT_SPEC = {
+    "aliases": ["weight_kg"],
+    "units": {"kg": (1.0, 0.0), "lb": (0.45359237, 0.0)},
+    "default_unit": "kg"
+}
+
+UNIT_SUFFIX = "_unit"
+
+# Subject identifier columns carried through to batch results, first match wins
+ID_ALIASES = ["id", "subject", "subject_id", "patient", "patient_id", "participant", "seqn"]
+
+# 1-based data row of the uploaded file (header excluded)
+SOURCE_ROW = "source_row"
+
+
+# ======================================================
+# COLUMN HELPERS
+# ======================================================
+
+def _find_column(df, name, aliases):
+    lookup = {column.lower(): column for column in df.columns}
+    for candidate in [name, *aliases]:
+        if candidate.lower() in lookup:
+            return lookup[candidate.lower()]
+    return None
+
+
+def find_id_column(df):
+    return _find_column(df, ID_ALIASES[0], ID_ALIASES[1:])
+
+
+def _numeric(df, column, counts, rule_prefix):
+    raw = df[column]
+    values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=float)
+    non_numeric = np.isnan(values) & raw.notna().to_numpy()
+    counts[f"{rule_prefix}:non_numeric"] = int(non_numeric.sum())
+    return values
+
+
+def _convert(df, column, key, spec, units, counts):
+    # A per-row unit column (<column>_unit) wins over the per-feature `units` mapping
+    default_unit = units.get(key, spec["default_unit"]).lower()
+    unit_column = _find_column(df, column + UNIT_SUFFIX, [])
+
+    if unit_column is not None:
+        unit = df[unit_column].fillna(default_unit).astype(str).str.strip().str.lower()
+    else:
+        unit = pd.Series(default_unit, index=df.index)
+
+    scale = unit.map({name: factor[0] for name, factor in spec["units"].items()})
+    offset = unit.map({name: factor[1] for name, factor in spec["units"].items()})
+
+    values = _numeric(df, column, counts, key)
+    present = ~np.isnan(values)
+
+    unknown = scale.isna().to_numpy() & present
+    counts[f"{key}:unknown_unit"] = int(unknown.sum())
+    counts[f"{key}:converted"] = int(
+        (present & ~unknown & (unit != spec["default_unit"]).to_numpy()).sum()
+    )
+
+    return values * scale.to_numpy(dtype=float) + offset.to_numpy(dtype=float)
+
+
+# ======================================================
+# NORMALIZATION STAGE
+# ======================================================
+
+def normalize_inputs(df, feature_names, units=None, schema=NORMALIZATION_SCHEMA):
+
+    units = units or {}
+    counts = {}
+    n = len(df)
+
+    X = np.full((n, len(feature_names)), np.nan)
+    out_of_range = np.zeros((n, len(feature_names)), dtype=bool)
+
+    for j, name in enumerate(feature_names):
+        spec = schema[name]
+        column = _find_column(df, name, spec["aliases"])
+
+        if column is None:
+            counts[f"{name}:column_absent"] = n
+            continue
+
+        values = _convert(df, column, name, spec, units, counts)
+
+        low, high = spec["valid_range"]
+        with np.errstate(invalid="ignore"):
+            out_of_range[:, j] = (values < low) | (values > high)
+        counts[f"{name}:out_of_range"] = int(out_of_range[:, j].sum())
+
+        X[:, j] = np.where(out_of_range[:, j], np.nan, values)
+
+    # ==================================================
+    # BMI FROM HEIGHT / WEIGHT
+    # ==================================================
+
+    if "BMXBMI" in feature_names:
+        j = feature_names.index("BMXBMI")
+        height_column = _find_column(df, "height", HEIGHT_SPEC["aliases"])
+        weight_column = _find_column(df, "weight", WEIGHT_SPEC["aliases"])
+
+        if height_column is not None and weight_column is not None:
+            height_m = _convert(df, height_column, "height", HEIGHT_SPEC, units, counts)
+            weight_kg = _convert(df, weight_column, "weight", WEIGHT_SPEC, units, counts)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                derived = weight_kg / height_m ** 2
+
+            low, high = schema["BMXBMI"]["valid_range"]
+            usable = np.isnan(X[:, j]) & ~out_of_range[:, j] & (derived >= low) & (derived <= high)
+            counts["BMXBMI:derived"] = int(usable.sum())
+            X[:, j] = np.where(usable, derived, X[:, j])
+
+    missing = np.isnan(X)
+    for j, name in enumerate(feature_names):
+        counts[f"{name}:imputed"] = int(missing[:, j].sum())
+
+    # Rows with no usable biomarker at all carry no signal beyond the imputer
+    rejected = missing.all(axis=1)
+    counts["row:rejected_no_values"] = int(rejected.sum())
+
+    return {
+        "X": pd.DataFrame(X, columns=feature_names, index=df.index),
+        "accepted": ~rejected,
+        "out_of_range": pd.DataFrame(out_of_range, columns=feature_names, index=df.index),
+        "counts": {rule: count for rule, count in counts.items() if count}
+    }
@@ -0,0 +1,149 @@
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# ======================================================
+# ON-DEMAND REQUEST PROFILING
+# ======================================================
+# One assessment or batch job is wrapped with cProfile (CPU) and
+# tracemalloc (allocations). The hot path is timed in laps, each one
+# measured from the previous lap. Each capture is written as one zip
+# (pstats dump + text summary) and only the newest PROFILE_KEEP are kept.
+# When profiling is off, requests get NULL_PROFILE, whose lap() does nothing.
+
+PROFILE_DIR = Path("data") / "profiles"
+PROFILE_KEEP = 20
+TOP_N = 40
+
+# tracemalloc is process-wide, so only one capture runs at a time;
+# requests arriving meanwhile are simply not profiled
+_capture_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class NullProfile:
+
+    path = None
+
+    def lap(self, name):
+        pass
+
+
+NULL_PROFILE = NullProfile()
+
+
+class RequestProfile:
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started_at = datetime.now()
+        self.profiler = cProfile.Profile()
+        self.laps = []
+        self.peak = 0
+        self.elapsed = 0.0
+        self.path = None
+        self._lap_start = time.perf_counter()
+
+    def lap(self, name):
+        # Wall time and allocation peak since the previous lap
+        now = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        tracemalloc.reset_peak()
+        self.laps.append((name, now - self._lap_start, peak))
+        self._lap_start = now
+
+
+def summary_text(profile, snapshot):
+
+    out = io.StringIO()
+    out.write(f"kind: {profile.kind}\n")
+    out.write(f"started: {profile.started_at.isoformat(timespec='seconds')}\n")
+    out.write(f"wall time: {profile.elapsed:.4f} s\n")
+    out.write(f"peak traced memory: {profile.peak / 1024 / 1024:.2f} MiB\n\n")
+
+    out.write("laps (wall s, peak traced MiB)\n")
+    for name, seconds, peak in profile.laps:
+        out.write(f"  {name:<20} {seconds:>9.4f} {peak / 1024 / 1024:>9.2f}\n")
+
+    for sort in ("cumulative", "tottime"):
+        out.write(f"\n=== cProfile, top {TOP_N} by {sort} ===\n")
+        pstats.Stats(profile.profiler, stream=out).sort_stats(sort).print_stats(TOP_N)
+
+    out.write(f"\n=== tracemalloc, top {TOP_N} live allocations by line ===\n")
+    for stat in snapshot.statistics("lineno")[:TOP_N]:
+        out.write(f"  {stat}\n")
+
+    return out.getvalue()
+
+
+def save_profile(profile, snapshot, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    name = f"{profile.started_at:%Y%m%d-%H%M%S}-{profile.kind}-{os.getpid()}-{threading.get_ident()}.zip"
+    profile.profiler.create_stats()
+
+    # Written next to the target and renamed, so readers never see a partial zip
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(handle, "wb") as f, zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("profile.prof", marshal.dumps(profile.profiler.stats))
+        archive.writestr("summary.txt", summary_text(profile, snapshot))
+    path = directory / name
+    os.replace(tmp_path, path)
+
+    for old in list_profiles(directory)[keep:]:
+        old.unlink(missing_ok=True)
+
+    return path
+
+
+def list_profiles(directory=PROFILE_DIR):
+    # Newest first
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(directory.glob("*.zip"), key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+@contextmanager
+def profiled(kind, enabled, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+
+    if not enabled or not _capture_lock.acquire(blocking=False):
+        yield NULL_PROFILE
+        return
+
+    profile = RequestProfile(kind)
+    owns_tracing = not tracemalloc.is_tracing()
+    if owns_tracing:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    profile.profiler.enable()
+    try:
+        yield profile
+    finally:
+        profile.profiler.disable()
+        profile.elapsed = time.perf_counter() - start
+        profile.lap("rest")
+        snapshot = tracemalloc.take_snapshot()
+        if owns_tracing:
+            tracemalloc.stop()
+        _capture_lock.release()
+        try:
+            profile.path = save_profile(profile, snapshot, directory, keep)
+        except OSError:
+            logger.exception("Could not write %s profile", kind)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: eviction still works, just without the cross-process lock
+    fcntl = None
+
+# ======================================================
+# CONTENT-ADDRESSED DISK CACHE
+# ======================================================
+# Entries live at <dir>/<key[:2]>/<key>.<kind>, where the key is the
+# SHA-256 of everything the value depends on. Writes go to a temp file
+# in the same directory and are renamed into place, so any number of
+# processes can read and write the same directory without locks. A hit
+# touches the file, and eviction drops the least recently used entries
+# once the directory grows past max_bytes.
+
+CACHE_DIR = Path("data") / "cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Fraction of the budget a process may write between two size checks
+EVICT_CHECK_FRACTION = 1 / 16
+EVICT_LOW_WATER = 0.9
+STALE_TMP_SECONDS = 3600
+
+
+def cache_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key, kind):
+        return self.directory / key[:2] / f"{key}.{kind}"
+
+    # ==================================================
+    # RAW BYTES
+    # ==================================================
+
+    def get_bytes(self, key, kind):
+        if not self.enabled:
+            return None
+        path = self._path(key, kind)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another process in between
+            return None
+        return data
+
+    def put_bytes(self, key, kind, data):
+        if not self.enabled:
+            return
+        path = self._path(key, kind)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        handle, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._written += len(data)
+            due = self._written >= self.max_bytes * EVICT_CHECK_FRACTION
+            if due:
+                self._written = 0
+        if due:
+            self.evict()
+
+    # ==================================================
+    # JSON VALUES
+    # ==================================================
+    # JSON rather than pickle: the directory is shared between replicas, and
+    # loading a pickle from it would run whatever code was written there.
+
+    def get(self, key, kind):
+        data = self.get_bytes(key, kind)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            # Unreadable entry (e.g. written by an incompatible version): treat as a miss
+            self._path(key, kind).unlink(missing_ok=True)
+            return None
+
+    def put(self, key, kind, value):
+        self.put_bytes(key, kind, json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    # ==================================================
+    # SIZE-BASED LRU EVICTION
+    # ==================================================
+
+    def evict(self):
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with open(self.directory / ".evict.lock", "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another process is already evicting
+                    return
+
+            now = time.time()
+            entries = []
+            for path in self.directory.glob("*/*"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if path.name.startswith("."):
+                    # Temp file left behind by a crashed writer
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        path.unlink(missing_ok=True)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+
+            for _, size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                total -= size
+                if total <= self.max_bytes * EVICT_LOW_WATER:
+                    break
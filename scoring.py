@@ -0,0 +1,662 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit, ndtr
+
+# ======================================================
+# VECTORIZED CALIBRATION
+# ======================================================
+# Array counterparts of app.score_to_percentile / percentile_to_demo_output,
+# used wherever many scores are mapped at once.
+
+PERCENTILE_FLOOR = 20
+PERCENTILE_CEILING = 90
+
+# Lower percentile bound of each interpretation band (see percentile_to_demo_output)
+CATEGORY_BOUNDS = np.array([30, 45, 60])
+
+
+def scores_to_percentiles(scores, reference_scores):
+    pct = np.searchsorted(reference_scores, scores, side="right") / len(reference_scores)
+    pct = np.clip(pct * 100, PERCENTILE_FLOOR, PERCENTILE_CEILING)
+    return np.round(pct).astype(int)
+
+
+def percentiles_to_category_codes(percentiles):
+    return np.searchsorted(CATEGORY_BOUNDS, percentiles, side="right")
+
+
+# ======================================================
+# MEASUREMENT UNCERTAINTY (MONTE CARLO)
+# ======================================================
+# Analytical variation per biomarker: absolute SD plus a CV proportional
+# to the measured value.
+
+MEASUREMENT_ERROR = {
+    "LBXGLU": {"sd": 0.0, "cv": 0.025},
+    "LBXGH": {"sd": 0.15, "cv": 0.0},
+    "LBXTR": {"sd": 0.0, "cv": 0.05},
+    "BMXBMI": {"sd": 0.3, "cv": 0.0}
+}
+
+MAX_SAMPLE_ROWS = 250_000
+
+
+def measurement_uncertainty(
+    model,
+    X,
+    feature_names,
+    reference_scores,
+    n_samples=2000,
+    interval=(5, 95),
+    measurement_error=MEASUREMENT_ERROR,
+    seed=None
+):
+
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    rng = np.random.default_rng(seed)
+
+    sd_abs = np.array([measurement_error[name]["sd"] for name in feature_names])
+    cv = np.array([measurement_error[name]["cv"] for name in feature_names])
+    sd = sd_abs + cv * np.abs(X)
+
+    n_categories = len(CATEGORY_BOUNDS) + 1
+    low = np.empty(len(X))
+    median = np.empty(len(X))
+    high = np.empty(len(X))
+    category_probs = np.empty((len(X), n_categories))
+
+    # Subjects are processed in chunks so n_subjects * n_samples stays bounded
+    chunk = max(1, MAX_SAMPLE_ROWS // n_samples)
+
+    for start in range(0, len(X), chunk):
+        stop = min(start + chunk, len(X))
+        n = stop - start
+
+        noise = rng.standard_normal((n, n_samples, X.shape[1]))
+        samples = np.maximum(X[start:stop, None, :] + noise * sd[start:stop, None, :], 0.0)
+
+        scores = model.predict_proba(
+            pd.DataFrame(samples.reshape(-1, X.shape[1]), columns=feature_names)
+        )[:, 1]
+        pct = scores_to_percentiles(scores, reference_scores).reshape(n, n_samples)
+
+        low[start:stop], median[start:stop], high[start:stop] = np.percentile(
+            pct, [interval[0], 50, interval[1]], axis=1
+        )
+
+        codes = percentiles_to_category_codes(pct) + np.arange(n)[:, None] * n_categories
+        category_probs[start:stop] = np.bincount(
+            codes.ravel(), minlength=n * n_categories
+        ).reshape(n, n_categories) / n_samples
+
+    return {
+        "interval": interval,
+        "n_samples": n_samples,
+        "low": np.round(low).astype(int),
+        "median": np.round(median).astype(int),
+        "high": np.round(high).astype(int),
+        "category_probs": category_probs
+    }
+
+
+# ======================================================
+# CLOSED-FORM COUNTERFACTUALS
+# ======================================================
+# The model is logistic over standardized features, so the logit is linear
+# in every raw biomarker. Each band boundary maps to a fixed score threshold
+# on the reference array, and the single-feature change that reaches it is
+# solved directly: delta_x = (logit_threshold - logit) * scale / weight.
+
+def band_threshold_scores(reference_scores, bounds=CATEGORY_BOUNDS):
+    # Smallest score whose percentile reaches each bound, mirroring
+    # the searchsorted / clip / round chain of score_to_percentile.
+    n = len(reference_scores)
+    pct = np.round(np.clip(np.arange(n + 1) / n * 100, PERCENTILE_FLOOR, PERCENTILE_CEILING))
+    k_min = np.searchsorted(pct, bounds, side="left")
+    return reference_scores[k_min - 1]
+
+
+def linear_logits(model, X):
+    imputer = model.named_steps["imputer"]
+    scaler = model.named_steps["scaler"]
+    logreg = model.named_steps["model"]
+
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    filled = np.where(np.isnan(X), imputer.statistics_, X)
+    scaled = (filled - scaler.mean_) / scaler.scale_
+
+    # Same operation order and memory layout as the pipeline (the imputer
+    # hands a column-major array to LogisticRegression.decision_function),
+    # so BLAS sums in the same order and scores match predict_proba bit for bit
+    scaled = np.asfortranarray(scaled)
+    return filled, (scaled @ logreg.coef_.T + logreg.intercept_).ravel()
+
+
+def predict_scores(model, X):
+    # NumPy equivalent of model.predict_proba(df)[:, 1], without the DataFrame path
+    _, logits = linear_logits(model, X)
+    return expit(logits)
+
+
+def category_counterfactuals(model, X, reference_scores, bounds=CATEGORY_BOUNDS):
+
+    scaler = model.named_steps["scaler"]
+    weights = model.named_steps["model"].coef_[0]
+
+    filled, logits = linear_logits(model, X)
+
+    thresholds = band_threshold_scores(reference_scores, bounds)
+    threshold_logits = np.log(thresholds / (1 - thresholds))
+
+    # (n_subjects, n_bounds, n_features)
+    delta = (
+        (threshold_logits[None, :, None] - logits[:, None, None])
+        * scaler.scale_ / weights
+    )
+
+    return {
+        "bounds": np.asarray(bounds),
+        "threshold_scores": thresholds,
+        "values": filled,
+        "delta": delta,
+        "target": filled[:, None, :] + delta
+    }
+
+
+# ======================================================
+# TWO-BIOMARKER RISK SURFACE
+# ======================================================
+
+def risk_surface(
+    model,
+    reference_scores,
+    values,
+    x_index,
+    y_index,
+    x_range,
+    y_range,
+    resolution=60,
+    bounds=CATEGORY_BOUNDS
+):
+
+    xs = np.linspace(*x_range, resolution)
+    ys = np.linspace(*y_range, resolution)
+    gx, gy = np.meshgrid(xs, ys)
+
+    grid = np.tile(np.asarray(values, dtype=float), (gx.size, 1))
+    grid[:, x_index] = gx.ravel()
+    grid[:, y_index] = gy.ravel()
+
+    percentiles = scores_to_percentiles(
+        predict_scores(model, grid), reference_scores
+    ).reshape(gy.shape)
+
+    # Band boundaries are straight lines in the (x, y) plane, since the
+    # logit is linear in both varied biomarkers.
+    scaler = model.named_steps["scaler"]
+    weights = model.named_steps["model"].coef_[0]
+    slope_x = weights[x_index] / scaler.scale_[x_index]
+    slope_y = weights[y_index] / scaler.scale_[y_index]
+
+    _, base_logit = linear_logits(model, grid[:1])
+    base_logit = base_logit[0] - slope_x * grid[0, x_index] - slope_y * grid[0, y_index]
+
+    thresholds = band_threshold_scores(reference_scores, bounds)
+    boundaries = {}
+    for bound, threshold in zip(bounds, thresholds):
+        line_y = (np.log(threshold / (1 - threshold)) - base_logit - slope_x * xs) / slope_y
+        inside = (line_y >= y_range[0]) & (line_y <= y_range[1])
+        boundaries[int(bound)] = (xs[inside], line_y[inside])
+
+    return {
+        "x": xs,
+        "y": ys,
+        "percentiles": percentiles,
+        "categories": percentiles_to_category_codes(percentiles),
+        "boundaries": boundaries
+    }
+
+
+# ======================================================
+# PER-BIOMARKER POPULATION PERCENTILES
+# ======================================================
+# Compact quantile tables built offline from the training population
+# (see build_bundle.py). Without a table the scaler's normal approximation
+# is used, which reproduces the previous z-score behaviour.
+
+FEATURE_QUANTILES_PATH = Path("models") / "feature_quantiles.npz"
+QUANTILE_GRID = np.linspace(0, 1, 201)
+
+
+def build_feature_quantiles(X, feature_names, probs=QUANTILE_GRID):
+    quantiles = np.nanquantile(np.asarray(X, dtype=float), probs, axis=0).T
+    return {
+        "features": np.array(feature_names),
+        "probs": np.asarray(probs, dtype=float),
+        "quantiles": quantiles
+    }
+
+
+def load_feature_quantiles(feature_names, path=FEATURE_QUANTILES_PATH):
+    if not Path(path).exists():
+        return None
+
+    with np.load(path) as data:
+        table = {key: data[key] for key in data.files}
+
+    order = [list(table["features"]).index(name) for name in feature_names]
+    table["features"] = table["features"][order]
+    table["quantiles"] = table["quantiles"][order]
+    return table
+
+
+def quantile_table_percentiles(X, table):
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    pct = np.empty_like(X)
+    for j in range(X.shape[1]):
+        pct[:, j] = np.interp(X[:, j], table["quantiles"][j], table["probs"]) * 100
+    return pct
+
+
+def feature_population_percentiles(model, X, table=None):
+
+    if table is None:
+        scaler = model.named_steps["scaler"]
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        return ndtr((X - scaler.mean_) / scaler.scale_) * 100
+
+    return quantile_table_percentiles(X, table)
+
+
+# ======================================================
+# CONTRIBUTION CONTEXT
+# ======================================================
+# Share of |weights * scaled| per feature, as in the app's explainability
+# section, plus its rank within the reference population's shares.
+
+CONTRIBUTION_QUANTILES_PATH = Path("models") / "contribution_quantiles.npz"
+
+
+def contribution_shares(model, X):
+
+    imputer = model.named_steps["imputer"]
+    scaler = model.named_steps["scaler"]
+    weights = model.named_steps["model"].coef_[0]
+
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    filled = np.where(np.isnan(X), imputer.statistics_, X)
+    raw = weights * (filled - scaler.mean_) / scaler.scale_
+
+    magnitude = np.abs(raw)
+    total = magnitude.sum(axis=1, keepdims=True)
+    shares = np.divide(
+        magnitude * 100, total,
+        out=np.zeros_like(magnitude), where=total != 0
+    )
+
+    return raw, shares
+
+
+def contribution_percentiles(shares, table):
+    if table is None:
+        return None
+    return quantile_table_percentiles(shares, table)
+
+
+# ======================================================
+# RECALIBRATION
+# ======================================================
+# Isotonic or Platt recalibration fitted offline (build_bundle.py) and
+# compiled to sorted score breakpoints, so a calibrated probability is one
+# searchsorted per score, like the percentile lookup.
+
+CALIBRATION_PATH = Path("models") / "calibration_table.npz"
+CALIBRATION_GRID_SIZE = 1024
+
+
+def fit_calibration_table(scores, labels, method="isotonic", grid_size=CALIBRATION_GRID_SIZE):
+
+    scores = np.asarray(scores, dtype=float)
+    labels = np.asarray(labels, dtype=int)
+
+    breakpoints = np.unique(np.quantile(scores, np.linspace(0, 1, grid_size)))
+    breakpoints[0] = 0.0
+
+    if method == "isotonic":
+        from sklearn.isotonic import IsotonicRegression
+        calibrator = IsotonicRegression(out_of_bounds="clip", y_min=0.0, y_max=1.0)
+        calibrator.fit(scores, labels)
+        values = calibrator.predict(breakpoints)
+    elif method == "platt":
+        from sklearn.linear_model import LogisticRegression
+        eps = 1e-6
+
+        def logit(p):
+            p = np.clip(p, eps, 1 - eps)
+            return np.log(p / (1 - p))
+
+        calibrator = LogisticRegression()
+        calibrator.fit(logit(scores)[:, None], labels)
+        values = calibrator.predict_proba(logit(breakpoints)[:, None])[:, 1]
+    else:
+        raise ValueError(f"Unknown calibration method: {method}")
+
+    return {"breakpoints": breakpoints, "values": values}
+
+
+def load_calibration_table(path=CALIBRATION_PATH):
+    if not Path(path).exists():
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def calibrated_probabilities(scores, table):
+    index = np.searchsorted(table["breakpoints"], scores, side="right") - 1
+    return table["values"][np.clip(index, 0, len(table["values"]) - 1)]
+
+
+# ======================================================
+# REFERENCE BOOTSTRAP BANDS
+# ======================================================
+# Percentile uncertainty from the finite reference sample. The table is
+# indexed by searchsorted(reference_scores, score, side="right"), exactly
+# the index score_to_percentile already computes, so a request only pays
+# for two array reads.
+
+REFERENCE_BANDS_PATH = Path("models") / "reference_bands.npz"
+
+
+def bootstrap_reference_bands(reference_scores, n_bootstrap=2000, level=95, seed=0):
+
+    n = len(reference_scores)
+    rng = np.random.default_rng(seed)
+
+    # counts[b, k]: how often reference position k is drawn in resample b;
+    # its cumulative sum is the number of resampled scores <= reference_scores[k]
+    counts = rng.multinomial(n, np.full(n, 1.0 / n), size=n_bootstrap)
+    at_or_below = np.concatenate(
+        [np.zeros((n_bootstrap, 1), dtype=counts.dtype), np.cumsum(counts, axis=1)],
+        axis=1
+    )
+
+    pct = np.round(np.clip(at_or_below / n * 100, PERCENTILE_FLOOR, PERCENTILE_CEILING))
+
+    alpha = (100 - level) / 2
+    low, high = np.percentile(pct, [alpha, 100 - alpha], axis=0)
+
+    return {
+        "low": np.floor(low).astype(np.uint8),
+        "high": np.ceil(high).astype(np.uint8),
+        "level": np.array(level),
+        "n_bootstrap": np.array(n_bootstrap)
+    }
+
+
+def load_reference_bands(info, reference_version, reference_scores, path=REFERENCE_BANDS_PATH):
+    # info is the "reference_bands" entry of emra_metadata.json and
+    # reference_version the 12-char sha256 prefix of reference_scores.npy
+    if not info or not Path(path).exists():
+        return None
+
+    # Stale tables built for a different reference array are ignored; a
+    # same-length array with other scores is only caught by the hash
+    if info.get("reference_sha256") != reference_version:
+        return None
+
+    with np.load(path) as data:
+        bands = {key: data[key] for key in data.files}
+    if len(bands["low"]) != len(reference_scores) + 1:
+        return None
+    return bands
+
+
+def percentile_bands(scores, reference_scores, bands):
+    index = np.searchsorted(reference_scores, scores, side="right")
+    return bands["low"][index].astype(int), bands["high"][index].astype(int)
+
+
+# ======================================================
+# STRATIFIED REFERENCE POPULATIONS
+# ======================================================
+# One sorted score array per age band x sex cell, packed back to back in
+# a single .npy that is memory-mapped read-only, so replicas share the
+# pages. The offset index (offsets, slots) lives in emra_metadata.json.
+# Segment 0 is always the global reference_scores.npy: subjects without
+# age/sex, and cells too small to stand on their own, resolve to it and
+# get exactly the global percentile.
+
+STRATA_PATH = Path("models") / "reference_strata.npy"
+GLOBAL_STRATUM = 0
+MIN_STRATUM_SIZE = 100
+
+# NHANES RIAGENDR coding
+SEX_CODES = {1: "male", 2: "female"}
+
+
+def build_stratified_reference(global_scores, scores, ages, sexes, age_edges,
+                               sex_codes=tuple(SEX_CODES), min_size=MIN_STRATUM_SIZE):
+
+    scores = np.asarray(scores, dtype=float)
+    ages = np.asarray(ages, dtype=float)
+    sexes = np.asarray(sexes, dtype=float)
+    bands = np.searchsorted(age_edges, ages, side="right")
+
+    segments = [np.sort(np.asarray(global_scores, dtype=float))]
+    slots = np.full((len(age_edges) + 1, len(sex_codes)), GLOBAL_STRATUM, dtype=np.int64)
+
+    for band in range(len(age_edges) + 1):
+        for s, code in enumerate(sex_codes):
+            cell = scores[(bands == band) & (sexes == code) & ~np.isnan(ages) & ~np.isnan(scores)]
+            if len(cell) >= min_size:
+                slots[band, s] = len(segments)
+                segments.append(np.sort(cell))
+
+    offsets = np.concatenate([[0], np.cumsum([len(segment) for segment in segments])])
+    return np.concatenate(segments), {"offsets": offsets, "slots": slots}
+
+
+def age_band_label(age_edges, band):
+    if band == 0:
+        return f"under {age_edges[0]:g}"
+    if band == len(age_edges):
+        return f"{age_edges[-1]:g} and over"
+    return f"{age_edges[band - 1]:g} to {age_edges[band]:g}"
+
+
+def load_stratified_reference(info, reference_scores, path=STRATA_PATH):
+    # info is the "reference_strata" entry of emra_metadata.json
+    if not info or not Path(path).exists():
+        return None
+
+    packed = np.load(path, mmap_mode="r")
+    offsets = np.asarray(info["offsets"], dtype=np.int64)
+
+    # Stale packs (other global reference, truncated file) are ignored
+    if offsets[-1] != len(packed) or not np.array_equal(packed[:offsets[1]], reference_scores):
+        return None
+
+    slots = np.asarray(info["slots"], dtype=np.int64)
+    labels = ["all ages and sexes"] * (len(offsets) - 1)
+    for band, row in enumerate(slots):
+        for sex_label, segment in zip(info["sex_labels"], row):
+            if segment != GLOBAL_STRATUM:
+                labels[segment] = f"{sex_label}, age {age_band_label(info['age_edges'], band)}"
+
+    return {
+        "packed": packed,
+        "offsets": offsets,
+        "sizes": np.diff(offsets),
+        "slots": slots,
+        "labels": labels,
+        "age_edges": np.asarray(info["age_edges"], dtype=float),
+        "sex_codes": np.asarray(info["sex_codes"], dtype=float),
+        "sex_labels": list(info["sex_labels"])
+    }
+
+
+def resolve_strata(strata, ages, sexes):
+    # Segment index per subject; unknown age or sex falls back to the global segment
+    ages, sexes = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(ages, dtype=float)),
+        np.atleast_1d(np.asarray(sexes, dtype=float))
+    )
+    bands = np.searchsorted(strata["age_edges"], ages, side="right")
+    matches = sexes[:, None] == strata["sex_codes"][None, :]
+    known = ~np.isnan(ages) & matches.any(axis=1)
+
+    segments = np.full(len(ages), GLOBAL_STRATUM, dtype=np.int64)
+    segments[known] = strata["slots"][bands[known], matches[known].argmax(axis=1)]
+    return segments
+
+
+def stratum_scores(strata, segment):
+    offsets = strata["offsets"]
+    return strata["packed"][offsets[segment]:offsets[segment + 1]]
+
+
+def stratified_percentiles(scores, strata, segments):
+
+    scores, segments = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(scores, dtype=float)),
+        np.atleast_1d(np.asarray(segments, dtype=np.int64))
+    )
+    packed = strata["packed"]
+    start = strata["offsets"][segments]
+    lo = start.copy()
+    hi = strata["offsets"][segments + 1]
+
+    # Bisection run for all rows at once, each inside its own segment of the
+    # packed array; lo ends at searchsorted(segment, score, side="right")
+    for _ in range(int(strata["sizes"].max()).bit_length()):
+        active = lo < hi
+        mid = (lo + hi) // 2
+        below = active & (packed[np.minimum(mid, len(packed) - 1)] <= scores)
+        lo = np.where(below, mid + 1, lo)
+        hi = np.where(active & ~below, mid, hi)
+
+    pct = (lo - start) / strata["sizes"][segments]
+    pct = np.clip(pct * 100, PERCENTILE_FLOOR, PERCENTILE_CEILING)
+    return np.round(pct).astype(int)
+
+
+# ======================================================
+# REDUCED-PRECISION (FLOAT32) SCORING
+# ======================================================
+# The float32 path halves the memory and bandwidth of the n x features
+# buffers. Its logits carry a rounding error bounded per row. Rows whose
+# logit falls within that bound of a reference step are rescored in
+# float64, so percentiles and categories always equal the float64 path.
+# Only the score and contribution values differ, by float32 rounding.
+
+FLOAT32_ERROR_FACTOR = 16
+FLOAT32_MARGIN = 1e-9
+
+
+def float32_contributions(model, X):
+
+    imputer = model.named_steps["imputer"]
+    scaler = model.named_steps["scaler"]
+    logreg = model.named_steps["model"]
+
+    X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+    mean = scaler.mean_.astype(np.float32)
+    scale = scaler.scale_.astype(np.float32)
+    weights = logreg.coef_[0].astype(np.float32)
+    intercept = np.float32(logreg.intercept_[0])
+
+    filled = np.where(np.isnan(X), imputer.statistics_.astype(np.float32), X)
+    raw = (filled - mean) / scale * weights
+    logits = raw.sum(axis=1) + intercept
+
+    # Unit-roundoff bound of the chain above (input conversion, subtract,
+    # divide, multiply, 4-term sum), with a generous constant
+    magnitude = (np.abs(filled) + np.abs(mean)) / scale * np.abs(weights)
+    bound = FLOAT32_ERROR_FACTOR * np.finfo(np.float32).eps * (magnitude.sum(axis=1) + abs(intercept))
+
+    return raw, logits, bound
+
+
+def float32_percentiles(model, X, logits, bound, reference_scores, exact=True):
+
+    with np.errstate(divide="ignore"):
+        reference_logits = np.log(reference_scores) - np.log1p(-reference_scores)
+
+    n = len(reference_scores)
+    logits = logits.astype(np.float64)
+    k = np.searchsorted(reference_logits, logits, side="right")
+    percentiles = np.round(np.clip(k / n * 100, PERCENTILE_FLOOR, PERCENTILE_CEILING)).astype(int)
+
+    rescored = np.zeros(len(logits), dtype=bool)
+    if exact:
+        # Neighbouring steps on both sides; the row is ambiguous if either is within the bound
+        below = reference_logits[np.maximum(k - 1, 0)]
+        above = reference_logits[np.minimum(k, n - 1)]
+        limit = bound + FLOAT32_MARGIN
+        rescored = (np.abs(logits - below) <= limit) | (np.abs(above - logits) <= limit)
+        if rescored.any():
+            X_64 = np.atleast_2d(np.asarray(X, dtype=float))[rescored]
+            percentiles[rescored] = scores_to_percentiles(predict_scores(model, X_64), reference_scores)
+
+    return percentiles, rescored
+
+
+# ======================================================
+# BATCH SCORING
+# ======================================================
+
+def score_batch(model, X, reference_scores, dtype=np.float64, compact=False, exact=True,
+                strata=None, segments=None):
+    # dtype=np.float32 selects the reduced-precision path (exact=False skips
+    # its float64 rescoring); compact stores percentile / category as uint8.
+    # With a stratified reference, segments gives each row's stratum
+    # (see resolve_strata); rows in segment 0 use the global reference.
+    stratified = strata is not None and segments is not None
+    if np.dtype(dtype) == np.float32:
+        contributions, logits, bound = float32_contributions(model, X)
+        scores = expit(logits)
+        percentiles, rescored = float32_percentiles(model, X, logits, bound, reference_scores, exact)
+        if stratified:
+            # The rescoring bound is only set up for the global reference,
+            # so rows ranked within a stratum are rescored in float64. With
+            # strata that is almost every row (17.2k of 20k in the
+            # equivalence harness), so float32 buys little there; only
+            # the contribution shares stay in float32
+            local = np.asarray(segments) != GLOBAL_STRATUM
+            if local.any():
+                X_64 = np.atleast_2d(np.asarray(X, dtype=float))[local]
+                percentiles[local] = stratified_percentiles(
+                    predict_scores(model, X_64), strata, np.asarray(segments)[local]
+                )
+                rescored |= local
+        magnitude = np.abs(contributions)
+        total = magnitude.sum(axis=1, keepdims=True)
+        shares = np.divide(
+            magnitude * np.float32(100), total,
+            out=np.zeros_like(magnitude), where=total != 0
+        )
+    else:
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        scores = predict_scores(model, X)
+        if stratified:
+            percentiles = stratified_percentiles(scores, strata, segments)
+        else:
+            percentiles = scores_to_percentiles(scores, reference_scores)
+        contributions, shares = contribution_shares(model, X)
+        rescored = np.zeros(len(scores), dtype=bool)
+
+    category_codes = percentiles_to_category_codes(percentiles)
+    if compact:
+        percentiles = percentiles.astype(np.uint8)
+        category_codes = category_codes.astype(np.uint8)
+
+    return {
+        "score": scores,
+        "percentile": percentiles,
+        "category_code": category_codes,
+        "contributions": contributions,
+        "shares": shares,
+        "rescored": int(rescored.sum())
+    }
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import websockets
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from loadtest import APP_PATH, ASSESS_LABEL, PDF_LABEL, fetch, find_widgets, rerun, server_healthy, wait_for_server
+from metrics import serve_endpoints
+
+# ======================================================
+# WARM START + READINESS PROBE
+# ======================================================
+# Streamlit only executes app.py once a session connects, so on a fresh
+# replica the first user would pay for joblib.load, the lookup tables,
+# sklearn's first-call overhead and ReportLab's font/style setup. This
+# launcher starts the server, drives one headless assessment and PDF
+# download through it, and only then answers /readyz with 200. Liveness
+# is /healthz. Arguments it does not know are passed to `streamlit run`.
+
+WARMUP_QUERY = "warmup=1"
+
+logger = logging.getLogger("emra.serve")
+
+
+class Replica:
+
+    def __init__(self, process, port):
+        self.process = process
+        self.port = port
+        self.ready = False
+        self.timings = {}
+
+    def healthz(self):
+        if self.process.poll() is None:
+            return 200, "ok\n"
+        return 503, "server exited\n"
+
+    def readyz(self):
+        if not self.ready:
+            return 503, "warming up\n"
+        if self.process.poll() is not None or not server_healthy(self.port):
+            return 503, "server unhealthy\n"
+        return 200, "ready\n" + "".join(f"{key} {value:.3f}\n" for key, value in self.timings.items())
+
+
+async def warm_up(port, timeout):
+
+    timings = {}
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+
+        # First page run: model bundle, reference arrays, lookup tables, default what-if surface
+        start = time.perf_counter()
+        elements, _ = await rerun(ws, [], timeout, WARMUP_QUERY)
+        timings["first_page_s"] = time.perf_counter() - start
+
+        assess = [b for b in find_widgets(elements, "button") if b.label == ASSESS_LABEL][0]
+
+        # The first assessment pays sklearn's first-call and ReportLab setup; the second is warm
+        for key in ("cold_assessment_s", "warm_assessment_s"):
+            start = time.perf_counter()
+            elements, finished = await rerun(
+                ws, [WidgetState(id=assess.id, trigger_value=True)], timeout, WARMUP_QUERY
+            )
+            timings[key] = time.perf_counter() - start
+            if finished != ForwardMsg.FINISHED_SUCCESSFULLY or find_widgets(elements, "exception"):
+                raise RuntimeError("Warm-up assessment failed")
+
+        pdf = [d for d in find_widgets(elements, "download_button") if d.label == PDF_LABEL]
+        if not pdf:
+            raise RuntimeError("Warm-up assessment produced no PDF report")
+        start = time.perf_counter()
+        await asyncio.to_thread(fetch, f"http://127.0.0.1:{port}{pdf[0].url}", timeout)
+        timings["pdf_download_s"] = time.perf_counter() - start
+
+    return timings
+
+
+def main():
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Run app.py, warm it up, then report ready.")
+    parser.add_argument("--port", type=int, default=8501, help="Streamlit server port")
+    parser.add_argument("--probe-host", default=os.environ.get("EMRA_PROBE_HOST", "127.0.0.1"))
+    parser.add_argument("--probe-port", type=int, default=int(os.environ.get("EMRA_PROBE_PORT", 9465)))
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--warmup-timeout", type=float, default=120.0)
+    args, streamlit_args = parser.parse_known_args()
+
+    start = time.perf_counter()
+    process = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+        "--server.headless", "true",
+        "--server.port", str(args.port),
+        *streamlit_args
+    ], cwd=APP_PATH.parent)
+
+    def stop(signum, frame):
+        process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    replica = Replica(process, args.port)
+    serve_endpoints(
+        {"/healthz": replica.healthz, "/readyz": replica.readyz},
+        args.probe_host, args.probe_port, "probe"
+    )
+
+    try:
+        wait_for_server(process, args.port, args.startup_timeout)
+        logger.info("Streamlit server up after %.2fs, warming up", time.perf_counter() - start)
+        replica.timings = asyncio.run(warm_up(args.port, args.warmup_timeout))
+    except Exception:
+        logger.exception("Warm-up failed, stopping the server")
+        process.terminate()
+        process.wait()
+        sys.exit(1)
+
+    replica.ready = True
+    logger.info(
+        "Ready after %.2fs: first page %.3fs, cold assessment %.3fs, warm assessment %.3fs, PDF download %.3fs",
+        time.perf_counter() - start,
+        replica.timings["first_page_s"],
+        replica.timings["cold_assessment_s"],
+        replica.timings["warm_assessment_s"],
+        replica.timings["pdf_download_s"]
+    )
+
+    sys.exit(process.wait())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from drift import DriftMonitor
+from scoring import build_feature_quantiles
+
+NAMES = ["LBXTR", "LBXGLU"]
+
+
+def sample(rng, n, glucose_shift=0.0):
+    return np.column_stack([
+        rng.lognormal(4.6, 0.5, n),
+        rng.normal(100 + glucose_shift, 10, n)
+    ])
+
+
+class DriftMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.train = sample(self.rng, 5000)
+
+    def alerts(self, live, table):
+        monitor = DriftMonitor(
+            self.rng.normal(size=1000), NAMES,
+            self.train.mean(axis=0), self.train.std(axis=0),
+            feature_quantiles=table
+        )
+        monitor.update(live, self.rng.normal(size=len(live)))
+        return monitor.report()["alerts"]
+
+    def test_skewed_feature_without_drift_is_quiet(self):
+        live = sample(self.rng, 2000)
+        live[::50, 1] = np.nan
+        table = build_feature_quantiles(self.train, NAMES)
+        self.assertEqual(self.alerts(live, None), [])
+        self.assertEqual(self.alerts(live, table), [])
+
+    def test_shift_alerts_with_and_without_table(self):
+        live = sample(self.rng, 2000, glucose_shift=10)
+        table = build_feature_quantiles(self.train, NAMES)
+        self.assertTrue(all(a.startswith("LBXGLU") for a in self.alerts(live, None)))
+        self.assertTrue(self.alerts(live, None))
+        self.assertTrue(all(a.startswith("LBXGLU") for a in self.alerts(live, table)))
+        self.assertTrue(self.alerts(live, table))
+
+
+if __name__ == "__main__":
+    unittest.main()
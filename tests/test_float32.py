@@ -0,0 +1,45 @@
+import json
+import unittest
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from equivalence import boundary_inputs, grid_inputs, load_app_reference, random_inputs
+from scoring import score_batch
+
+MODELS_DIR = Path("models")
+
+
+class Float32ScoringTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with warnings.catch_warnings():
+            # Bundles pickled by a neighbouring scikit-learn release still load
+            warnings.simplefilter("ignore")
+            cls.model = joblib.load(MODELS_DIR / "emra_pipeline.joblib")
+        cls.reference_scores = np.load(MODELS_DIR / "reference_scores.npy")
+        with open(MODELS_DIR / "emra_metadata.json", "r", encoding="utf-8") as f:
+            cls.feature_names = json.load(f)["features"]
+        cls.ranges = load_app_reference(cls.reference_scores)[2]
+
+    def assert_matches_float64(self, X):
+        full = score_batch(self.model, X, self.reference_scores)
+        fast = score_batch(self.model, X, self.reference_scores, dtype=np.float32)
+        self.assertEqual(int((fast["percentile"] != full["percentile"]).sum()), 0)
+        self.assertEqual(int((fast["category_code"] != full["category_code"]).sum()), 0)
+
+    def test_grid(self):
+        self.assert_matches_float64(grid_inputs(self.ranges, self.feature_names, 8))
+
+    def test_band_boundaries(self):
+        profiles = random_inputs(self.ranges, self.feature_names, 40, np.random.default_rng(0), widen=0.0)
+        X = boundary_inputs(self.model, profiles, self.reference_scores)
+        self.assertGreater(len(X), 0)
+        self.assert_matches_float64(X)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import ingest
+from ingest import join_panels, read_fhir_observations, read_hl7_observations
+
+
+def observation(code, value, unit, patient="a", **effective):
+    resource = {
+        "resourceType": "Observation",
+        "code": {"coding": [{"system": "http://loinc.org", "code": code}]},
+        "valueQuantity": {"value": value, "code": unit},
+        "subject": {"reference": f"Patient/{patient}"}
+    }
+    resource.update(effective)
+    return resource
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def write(self, suffix, text):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        self.addCleanup(os.unlink, path)
+        return path
+
+
+class FhirBundleTest(IngestTestCase):
+
+    def test_entries_split_across_chunks(self):
+        resources = [
+            observation("1558-6", 95, "mg/dL", effectiveDateTime="2023-05-14T08:00:00Z"),
+            observation("4548-4", 5.6, "%", effectiveDateTime="2023-05-14T08:00:00Z"),
+            {"resourceType": "Patient", "id": "a", "name": [{"given": ["x" * 50]}]},
+            observation("2571-8", 140, "mg/dL", patient="b", effectiveDateTime="2023-05-15")
+        ]
+        bundle = json.dumps({
+            "resourceType": "Bundle",
+            "meta": {"note": "padding " * 20},
+            "entry": [{"resource": r} for r in resources]
+        }, indent=1)
+        path = self.write(".json", bundle)
+
+        # Chunks far smaller than one entry force every boundary case
+        for chunk_size in (1, 7, 64):
+            with mock.patch.object(ingest, "CHUNK_SIZE", chunk_size):
+                observations = list(read_fhir_observations(path))
+            self.assertEqual(
+                [(o["patient"], o["feature"], o["value"]) for o in observations],
+                [("a", "LBXGLU", 95), ("a", "LBXGH", 5.6), ("b", "LBXTR", 140)]
+            )
+
+
+class FhirTimeTest(IngestTestCase):
+
+    def read(self, *resources):
+        path = self.write(".ndjson", "\n".join(json.dumps(r) for r in resources))
+        counts = {}
+        return list(read_fhir_observations(path, counts)), counts
+
+    def test_partial_dates_pad_to_period_start(self):
+        observations, _ = self.read(
+            observation("1558-6", 95, "mg/dL", effectiveDateTime="2023"),
+            observation("1558-6", 96, "mg/dL", effectiveDateTime="2023-05")
+        )
+        self.assertEqual(
+            [o["time"] for o in observations],
+            [datetime(2023, 1, 1), datetime(2023, 5, 1)]
+        )
+
+    def test_effective_forms_and_offsets(self):
+        observations, _ = self.read(
+            observation("1558-6", 95, "mg/dL", effectiveInstant="2023-05-14T09:00:00+02:00"),
+            observation("1558-6", 96, "mg/dL", effectivePeriod={"start": "2023-05-14T09:00:00Z"})
+        )
+        self.assertEqual(
+            [o["time"] for o in observations],
+            [datetime(2023, 5, 14, 7), datetime(2023, 5, 14, 9)]
+        )
+
+    def test_bad_time_is_counted_not_raised(self):
+        observations, counts = self.read(
+            observation("1558-6", 95, "mg/dL", effectiveDateTime="garbage"),
+            observation("1558-6", 96, "mg/dL", effectiveDateTime="2023-05-14")
+        )
+        self.assertEqual([o["value"] for o in observations], [96])
+        self.assertEqual(counts, {"observation:rejected_bad_time": 1})
+
+
+class Hl7Test(IngestTestCase):
+
+    def message(self, control_id, patient, request_time, *obx):
+        return "\r".join([
+            f"MSH|^~\\&|LAB||||20230514||ORU^R01|{control_id}|P|2.5",
+            f"PID|||{patient}",
+            f"OBR|1||||||{request_time}",
+            *obx
+        ]) + "\r"
+
+    def test_bad_timestamp_does_not_stop_the_stream(self):
+        path = self.write(".hl7", "".join([
+            self.message(1, "p1", "20230514080000", "OBX|1|NM|1558-6^FGlu||99|mg/dL"),
+            self.message(2, "p2", "20231345", "OBX|1|NM|1558-6^FGlu||101|mg/dL"),
+            self.message(3, "p3", "20230514", "OBX|1|NM|1558-6^FGlu||103|mg/dL||||||||2023051499")
+        ]))
+        counts = {}
+        observations = list(read_hl7_observations(path, counts))
+        self.assertEqual([o["patient"] for o in observations], ["p1"])
+        self.assertEqual(counts, {"observation:rejected_bad_time": 2})
+
+    def test_offsets_are_converted_to_utc(self):
+        path = self.write(".hl7", self.message(
+            1, "p1", "202305140800+0200",
+            "OBX|1|NM|1558-6^FGlu||99|mg/dL",
+            "OBX|2|NM|4548-4^A1c||5.5|%||||||||20230514093000.5-0100"
+        ))
+        observations = list(read_hl7_observations(path))
+        self.assertEqual(
+            [o["time"] for o in observations],
+            [datetime(2023, 5, 14, 6), datetime(2023, 5, 14, 10, 30)]
+        )
+
+
+class UnitMappingTest(IngestTestCase):
+
+    def test_ucum_codes_map_to_normalizer_units(self):
+        self.assertEqual(ingest._unit("[lb_av]"), "lb")
+        self.assertEqual(ingest._unit("[in_i]"), "in")
+        self.assertEqual(ingest._unit("kg/m2"), "kg/m2")
+        self.assertEqual(ingest._unit("mg/dL"), "mg/dl")
+        self.assertIsNone(ingest._unit(""))
+
+    def test_ucum_unit_reaches_panel(self):
+        path = self.write(".ndjson", json.dumps(
+            observation("29463-7", 176, "[lb_av]", effectiveDateTime="2023-05-14")
+        ))
+        panel = next(join_panels(read_fhir_observations(path)))
+        self.assertEqual((panel["weight"], panel["weight_unit"]), (176, "lb"))
+
+
+class JoinPanelsTest(unittest.TestCase):
+
+    def obs(self, patient, day, feature, value):
+        return {"patient": patient, "time": datetime(2023, 1, 1) + timedelta(days=day),
+                "feature": feature, "value": value, "unit": None}
+
+    def test_window_splits_and_latest_value_wins(self):
+        panels = list(join_panels([
+            self.obs("a", 0, "LBXGLU", 90),
+            self.obs("a", 10, "LBXGLU", 95),
+            self.obs("a", 5, "LBXGH", 5.5),
+            self.obs("a", 45, "LBXGLU", 120)
+        ], window=timedelta(days=30)))
+
+        self.assertEqual(len(panels), 2)
+        self.assertEqual((panels[0]["LBXGLU"], panels[0]["LBXGH"]), (95, 5.5))
+        self.assertEqual(panels[0]["window_end"], datetime(2023, 1, 11))
+        self.assertEqual(panels[1]["LBXGLU"], 120)
+
+    def test_max_open_emits_least_recently_updated(self):
+        panels = list(join_panels([
+            self.obs("a", 0, "LBXGLU", 90),
+            self.obs("b", 0, "LBXGLU", 91),
+            self.obs("a", 1, "LBXGH", 5.5),
+            self.obs("c", 1, "LBXGLU", 92)
+        ], max_open=2))
+
+        self.assertEqual([p["patient"] for p in panels], ["b", "a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
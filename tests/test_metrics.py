@@ -0,0 +1,40 @@
+import threading
+import unittest
+
+from metrics import Metrics
+
+
+def record(metrics):
+    metrics.inc("emra_requests_total", kind="assessment")
+    metrics.observe("inference", 0.002)
+
+
+class ShardRetirementTest(unittest.TestCase):
+
+    def test_finished_threads_do_not_keep_shards(self):
+        metrics = Metrics()
+        for _ in range(500):
+            thread = threading.Thread(target=record, args=(metrics,))
+            thread.start()
+            thread.join()
+
+        metrics.render()
+        self.assertLessEqual(len(metrics._shards), 1)
+
+    def test_totals_survive_retirement(self):
+        metrics = Metrics()
+        for _ in range(50):
+            thread = threading.Thread(target=record, args=(metrics,))
+            thread.start()
+            thread.join()
+        record(metrics)
+
+        text = metrics.render()
+        self.assertIn('emra_requests_total{kind="assessment"} 51', text)
+        self.assertIn('emra_stage_latency_seconds_count{stage="inference"} 51', text)
+        # Retiring again on a later scrape must not double count
+        self.assertEqual(text, metrics.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
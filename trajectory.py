@@ -0,0 +1,150 @@
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+# ======================================================
+# LONGITUDINAL HISTORY STORE
+# ======================================================
+# Every visit is appended to `visits`; `trajectories` keeps one running
+# summary row per subject so a new visit only needs the previous state,
+# never a rescan of the subject's whole history.
+
+HISTORY_PATH = Path("data") / "emra_history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    subject_id  TEXT NOT NULL,
+    visit_no    INTEGER NOT NULL,
+    visited_at  TEXT NOT NULL,
+    percentile  INTEGER NOT NULL,
+    category    TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    PRIMARY KEY (subject_id, visit_no)
+);
+CREATE TABLE IF NOT EXISTS trajectories (
+    subject_id  TEXT PRIMARY KEY,
+    state       TEXT NOT NULL
+);
+"""
+
+
+def connect(path=HISTORY_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ======================================================
+# INCREMENTAL TRAJECTORY UPDATE
+# ======================================================
+
+def update_trajectory(state, visit):
+
+    contributions = visit["contributions"]
+
+    if state is None:
+        return {
+            "n_visits": 1,
+            "first_visited_at": visit["visited_at"],
+            "first_percentile": visit["percentile"],
+            "first_category": visit["category"],
+            "last_visited_at": visit["visited_at"],
+            "last_percentile": visit["percentile"],
+            "last_category": visit["category"],
+            "last_contributions": contributions,
+            "min_percentile": visit["percentile"],
+            "max_percentile": visit["percentile"],
+            "n_transitions": 0,
+            "previous_visited_at": None,
+            "percentile_change": None,
+            "total_change": 0,
+            "category_transition": None,
+            "contribution_deltas": {},
+            "top_mover": None
+        }
+
+    previous = state["last_contributions"]
+    deltas = {
+        name: round(float(value) - float(previous.get(name, 0.0)), 3)
+        for name, value in contributions.items()
+    }
+
+    top_name = max(deltas, key=lambda name: abs(deltas[name])) if deltas else None
+    top_mover = (
+        {"feature": top_name, "delta": deltas[top_name]}
+        if top_name is not None else None
+    )
+
+    transition = None
+    if visit["category"] != state["last_category"]:
+        transition = {"from": state["last_category"], "to": visit["category"]}
+
+    return {
+        **state,
+        "n_visits": state["n_visits"] + 1,
+        "last_visited_at": visit["visited_at"],
+        "last_percentile": visit["percentile"],
+        "last_category": visit["category"],
+        "last_contributions": contributions,
+        "min_percentile": min(state["min_percentile"], visit["percentile"]),
+        "max_percentile": max(state["max_percentile"], visit["percentile"]),
+        "n_transitions": state["n_transitions"] + (transition is not None),
+        "previous_visited_at": state["last_visited_at"],
+        "percentile_change": visit["percentile"] - state["last_percentile"],
+        "total_change": visit["percentile"] - state["first_percentile"],
+        "category_transition": transition,
+        "contribution_deltas": deltas,
+        "top_mover": top_mover
+    }
+
+
+# ======================================================
+# PERSISTENCE
+# ======================================================
+
+def load_trajectory(subject_id, path=HISTORY_PATH):
+    with closing(connect(path)) as conn:
+        row = conn.execute(
+            "SELECT state FROM trajectories WHERE subject_id = ?",
+            (subject_id,)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def record_visit(subject_id, visit, path=HISTORY_PATH):
+
+    with closing(connect(path)) as conn:
+        # BEGIN IMMEDIATE serialises concurrent sessions writing the same subject
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state FROM trajectories WHERE subject_id = ?",
+                (subject_id,)
+            ).fetchone()
+
+            state = update_trajectory(json.loads(row[0]) if row else None, visit)
+
+            conn.execute(
+                "INSERT INTO visits VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    subject_id,
+                    state["n_visits"],
+                    visit["visited_at"],
+                    visit["percentile"],
+                    visit["category"],
+                    json.dumps(visit)
+                )
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO trajectories VALUES (?, ?)",
+                (subject_id, json.dumps(state))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return state